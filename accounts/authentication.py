@@ -0,0 +1,158 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+User = get_user_model()
+
+# the columns request.user is built from; anything else is loaded lazily on first access.
+# Model.from_db() takes a subset of columns in concrete field order, so keep them in that order.
+USER_FIELDS = tuple(field.attname for field in User._meta.concrete_fields if field.attname in {
+    'id', 'email', 'username', 'first_name', 'last_name', 'role',
+    'is_active', 'is_staff', 'is_superuser', 'is_email_verified',
+})
+# cached users are tuples in USER_FIELDS order; keying them by the field list means a deploy that
+# changes it never reads tuples of the old shape
+USER_FIELDS_DIGEST = hashlib.md5(','.join(USER_FIELDS).encode()).hexdigest()[:8]
+
+
+class LocalTTLCache:
+    """Small thread-safe LRU whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_users = LocalTTLCache(settings.AUTH_USER_LOCAL_CACHE_SIZE, settings.AUTH_USER_LOCAL_CACHE_TTL)
+
+
+def get_auth_cache():
+    return caches[settings.AUTH_USER_CACHE_ALIAS]
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{USER_FIELDS_DIGEST}:{user_id}'
+
+
+def blacklist_cache_key(jti):
+    return f'auth:blacklist:{jti}'
+
+
+def get_user_fields(user_id):
+    """
+    USER_FIELDS of a user from the process LRU, then the shared cache, then the database. The shared
+    tier is only used when AUTH_USER_CACHE_TIMEOUT is set, i.e. when the cache really is shared:
+    a per-process cache would keep serving a deactivated user long after the LRU entry expired.
+    """
+    key = user_cache_key(user_id)
+    fields = local_users.get(key)
+    if fields is None:
+        fields = get_auth_cache().get(key) if settings.AUTH_USER_CACHE_TIMEOUT else None
+        if fields is None:
+            fields = User.objects.filter(pk=user_id).values_list(*USER_FIELDS).first()
+            if fields is None:
+                return None
+            if settings.AUTH_USER_CACHE_TIMEOUT:
+                get_auth_cache().set(key, fields, settings.AUTH_USER_CACHE_TIMEOUT)
+        local_users.set(key, fields)
+    return fields
+
+
+def invalidate_user(user_id):
+    key = user_cache_key(user_id)
+    local_users.delete(key)
+    get_auth_cache().delete(key)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request user SELECT: request.user is a User built from
+    cached columns (other fields are deferred and load on access; save() only writes loaded ones).
+    Entries are dropped when the user is saved or deleted in this process (accounts.signals);
+    other processes see the change once AUTH_USER_LOCAL_CACHE_TTL passes.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        fields = get_user_fields(user_id)
+        if fields is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        user = User.from_db(router.db_for_read(User), USER_FIELDS, fields)
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+
+class CachedBlacklistRefreshToken(RefreshToken):
+    """
+    RefreshToken whose blacklist lookup is cached. Blacklisted jtis are remembered until the token
+    expires; blacklisting from anywhere (rotation, logout, admin) creates a BlacklistedToken, whose
+    post_save marks the jti (accounts.signals). Clean lookups are cached for AUTH_BLACKLIST_CACHE_TIMEOUT,
+    which must stay 0 unless the cache is shared, or another process could accept a rotated token.
+    """
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        key = blacklist_cache_key(jti)
+        blacklisted = get_auth_cache().get(key)
+        if blacklisted is None:
+            blacklisted = BlacklistedToken.objects.filter(token__jti=jti).exists()
+            if blacklisted:
+                remember_blacklisted(jti, self.payload['exp'])
+            elif settings.AUTH_BLACKLIST_CACHE_TIMEOUT:
+                get_auth_cache().set(key, False, settings.AUTH_BLACKLIST_CACHE_TIMEOUT)
+        if blacklisted:
+            raise TokenError(_("Token is blacklisted"))
+
+
+def remember_blacklisted(jti, expires_at):
+    """`expires_at` is a Unix timestamp or datetime; once the token has expired it fails on exp anyway."""
+    if not isinstance(expires_at, (int, float)):
+        expires_at = expires_at.timestamp()
+    get_auth_cache().set(blacklist_cache_key(jti), True, max(int(expires_at - time.time()), 1))
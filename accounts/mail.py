@@ -0,0 +1,135 @@
+import base64
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.utils import timezone
+from accounts.models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """
+    Email backend that only writes messages to the OutboundEmail outbox, so request handlers never
+    wait on SMTP. `manage.py send_queued_emails` delivers them through EMAIL_DELIVERY_BACKEND.
+    """
+
+    def send_messages(self, email_messages):
+        rows = []
+        for message in email_messages:
+            if not message.recipients():
+                continue
+            attachments = []
+            for attachment in message.attachments:
+                if not isinstance(attachment, tuple):
+                    # a prebuilt MIMEBase part can't be stored as [filename, content, mimetype]; fail loudly
+                    # rather than send the mail without it
+                    raise ValueError("QueuedEmailBackend only queues attachments added as (filename, content, "
+                                     "mimetype); attach the file with EmailMessage.attach(filename, content, mimetype)")
+                filename, content, mimetype = attachment
+                if isinstance(content, str):
+                    content = content.encode()
+                attachments.append([filename, base64.b64encode(content).decode(), mimetype])
+            rows.append(OutboundEmail(
+                subject=message.subject, body=message.body, from_email=message.from_email,
+                to=list(message.to), cc=list(message.cc), bcc=list(message.bcc), reply_to=list(message.reply_to),
+                headers=dict(message.extra_headers),
+                alternatives=[list(alternative) for alternative in getattr(message, 'alternatives', [])],
+                attachments=attachments,
+            ))
+        try:
+            OutboundEmail.objects.bulk_create(rows)
+        except Exception:
+            if not self.fail_silently:
+                raise
+            return 0
+        return len(rows)
+
+
+def build_message(email, connection):
+    message = EmailMultiAlternatives(
+        subject=email.subject, body=email.body, from_email=email.from_email, to=email.to, cc=email.cc,
+        bcc=email.bcc, reply_to=email.reply_to, headers=email.headers, connection=connection,
+        alternatives=[tuple(alternative) for alternative in email.alternatives],
+    )
+    for filename, content, mimetype in email.attachments:
+        message.attach(filename, base64.b64decode(content), mimetype)
+    return message
+
+
+def retry_delay(attempts):
+    """Exponential backoff with full jitter, capped at EMAIL_QUEUE_MAX_RETRY_DELAY seconds."""
+    ceiling = min(settings.EMAIL_QUEUE_RETRY_DELAY * 2 ** (attempts - 1), settings.EMAIL_QUEUE_MAX_RETRY_DELAY)
+    return timedelta(seconds=random.uniform(ceiling / 2, ceiling))
+
+
+def claim_emails(batch_size):
+    """
+    Move up to `batch_size` due emails to sending. A claim lasts EMAIL_QUEUE_CLAIM_TIMEOUT seconds;
+    emails left in sending after that (a worker died mid-batch) become due again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status__in=[OutboundEmail.PENDING, OutboundEmail.SENDING], next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        OutboundEmail.objects.filter(id__in=ids).update(
+            status=OutboundEmail.SENDING,
+            next_attempt_at=now + timedelta(seconds=settings.EMAIL_QUEUE_CLAIM_TIMEOUT),
+        )
+    return list(OutboundEmail.objects.filter(id__in=ids).order_by('id'))
+
+
+def mark_failed_attempt(email, error):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= settings.EMAIL_QUEUE_MAX_ATTEMPTS:
+        email.status = OutboundEmail.FAILED
+    else:
+        email.status = OutboundEmail.PENDING
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+
+
+def deliver(emails):
+    """Send a claimed batch over a single connection; returns the number delivered."""
+    connection = get_connection(settings.EMAIL_DELIVERY_BACKEND)
+    try:
+        connection.open()
+    except Exception as exc:
+        logger.warning("Could not connect to the mail server: %s", exc)
+        for email in emails:
+            mark_failed_attempt(email, exc)
+    else:
+        try:
+            for email in emails:
+                try:
+                    build_message(email, connection).send()
+                except Exception as exc:
+                    logger.warning("Sending email %s failed: %s", email.pk, exc)
+                    mark_failed_attempt(email, exc)
+                else:
+                    email.attempts += 1
+                    email.status = OutboundEmail.SENT
+                    email.sent_at = timezone.now()
+                    email.last_error = None
+        finally:
+            connection.close()
+    OutboundEmail.objects.bulk_update(emails, ['status', 'attempts', 'last_error', 'next_attempt_at', 'sent_at'])
+    return sum(email.status == OutboundEmail.SENT for email in emails)
+
+
+def send_queued_emails(batch_size=50):
+    """Drain due emails in batches; returns (sent, handled)."""
+    sent = handled = 0
+    while emails := claim_emails(batch_size):
+        sent += deliver(emails)
+        handled += len(emails)
+    return sent, handled
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from accounts.mail import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = "Deliver emails queued in the outbox, one mail server connection per batch"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--loop', action='store_true', help="keep polling for new emails")
+        parser.add_argument('--interval', type=float, default=2.0, help="seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, handled = send_queued_emails(options['batch_size'])
+            if handled:
+                self.stdout.write(f"Sent {sent} of {handled} queued emails")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -12,4 +12,10 @@ class IsOwnerOrReadonly(BasePermission):
             return True
         if obj.user == request.user:
             return True
-        return request.method in SAFE_METHODS
\ No newline at end of file
+        return request.method in SAFE_METHODS
+
+class IsSeller(BasePermission):
+    message = 'Only sellers can access this.'
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated and request.user.role == 'seller')
@@ -1,4 +1,6 @@
 from rest_framework import serializers
+from dj_rest_auth.jwt_auth import CookieTokenRefreshSerializer
+from accounts.authentication import CachedBlacklistRefreshToken
 from accounts.models import Profile
 from django.contrib.auth import get_user_model
 
@@ -63,3 +65,8 @@ class UserDetailsSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         instance.save()
         return instance
+
+
+# token refresh with the blacklist lookup served from cache
+class CachedTokenRefreshSerializer(CookieTokenRefreshSerializer):
+    token_class = CachedBlacklistRefreshToken
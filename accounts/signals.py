@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from accounts.authentication import USER_FIELDS, invalidate_user, remember_blacklisted
+
+User = get_user_model()
+
+
+# cached request.user (accounts.authentication)
+@receiver(post_save, sender=User)
+def invalidate_saved_user(sender, instance, update_fields=None, raw=False, **kwargs):
+    # e.g. login only writes last_login, which the cache doesn't hold
+    if raw or (update_fields is not None and not set(update_fields) & set(USER_FIELDS)):
+        return
+    invalidate_user(instance.pk)
+    # again after commit, in case a concurrent request re-cached the old row meanwhile
+    transaction.on_commit(lambda: invalidate_user(instance.pk))
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def cache_blacklisted_token(sender, instance, raw=False, **kwargs):
+    if not raw:
+        remember_blacklisted(instance.token.jti, instance.token.expires_at)
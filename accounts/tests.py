@@ -1,3 +1,149 @@
-from django.test import TestCase
+from datetime import timedelta
+from email.mime.text import MIMEText
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from accounts.authentication import CachedJWTAuthentication, get_auth_cache, local_users
+from accounts.mail import send_queued_emails
+from accounts.models import OutboundEmail
+
+User = get_user_model()
+
+
+class CachedAuthenticationTests(APITestCase):
+    def setUp(self):
+        local_users.clear()
+        get_auth_cache().clear()
+        self.user = User.objects.create_user(email='buyer@example.com', password='pass', username='buyer',
+                                             role='buyer')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def get_cart(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('products:cart'))
+        return response, [query['sql'] for query in ctx.captured_queries if 'FROM "user"' in query['sql']]
+
+    def test_user_is_loaded_once(self):
+        response, user_queries = self.get_cart()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(user_queries), 1)
+        response, user_queries = self.get_cart()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(user_queries, [])
+
+    def test_user_columns_land_on_the_right_attributes(self):
+        seller = User.objects.create_user(email='seller@example.com', password='pass', username='seller',
+                                          role='seller', is_staff=True, first_name='Sam', last_name='Seller')
+        token = RefreshToken.for_user(seller).access_token
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        for _ in range(2):  # from the database, then from the cache
+            user, _ = CachedJWTAuthentication().authenticate(request)
+            self.assertEqual((user.pk, user.email, user.username, user.role), (seller.pk, 'seller@example.com',
+                                                                               'seller', 'seller'))
+            self.assertEqual((user.first_name, user.last_name), ('Sam', 'Seller'))
+            self.assertIs(user.is_staff, True)
+            self.assertIs(user.is_superuser, False)
+            self.assertIs(user.is_active, True)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.client.get(reverse('products:seller-sales')).status_code, 200)
+
+    def test_saving_the_user_invalidates_the_cache(self):
+        self.get_cart()
+        self.user.is_active = False
+        self.user.save()
+        response, _ = self.get_cart()
+        self.assertEqual(response.status_code, 401)
+
+    def test_rotated_refresh_token_is_rejected(self):
+        refresh = RefreshToken.for_user(self.user)
+        url = reverse('cached_token_refresh')
+        self.client.credentials()
+        response = self.client.post(url, {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(BlacklistedToken.objects.filter(token__jti=refresh['jti']).exists())
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse([query for query in ctx.captured_queries if 'blacklist' in query['sql']])
+
+
+class CountingBackend(LocmemBackend):
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return super().open()
+
+
+class UnreachableBackend(LocmemBackend):
+    def open(self):
+        raise ConnectionRefusedError("mail server is down")
+
+
+@override_settings(EMAIL_BACKEND='accounts.mail.QueuedEmailBackend',
+                   EMAIL_DELIVERY_BACKEND='accounts.tests.CountingBackend')
+class EmailQueueTests(TestCase):
+    def queue(self, count=1):
+        for i in range(count):
+            message = EmailMultiAlternatives(f'Hello {i}', 'Plain body', 'shop@example.com', [f'user{i}@example.com'])
+            message.attach_alternative('<p>Html body</p>', 'text/html')
+            message.attach('receipt.txt', 'Thanks', 'text/plain')
+            message.send()
+
+    def test_register_queues_the_confirmation(self):
+        response = self.client.post(reverse('accounts:rest_register'), {
+            'username': 'new', 'email': 'new@example.com', 'first_name': 'New', 'last_name': 'Buyer', 'role': 'buyer',
+            'password': 'Str0ng-pass!', 'confirm_password': 'Str0ng-pass!',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(list(OutboundEmail.objects.values_list('to', 'status')),
+                         [(['new@example.com'], OutboundEmail.PENDING)])
+
+        self.assertEqual(send_queued_emails(), (1, 1))
+        self.assertEqual(mail.outbox[0].to, ['new@example.com'])
+
+    def test_batch_is_sent_over_one_connection(self):
+        self.queue(3)
+        CountingBackend.opened = 0
+        self.assertEqual(send_queued_emails(batch_size=10), (3, 3))
+        self.assertEqual(CountingBackend.opened, 1)
+
+        sent = mail.outbox[0]
+        self.assertEqual(sent.alternatives, [('<p>Html body</p>', 'text/html')])
+        self.assertEqual(sent.attachments[0][:2], ('receipt.txt', 'Thanks'))
+        self.assertFalse(OutboundEmail.objects.exclude(status=OutboundEmail.SENT).exists())
+
+    def test_mime_attachments_are_refused_not_dropped(self):
+        message = EmailMultiAlternatives('Hello', 'Plain body', 'shop@example.com', ['user@example.com'])
+        message.attach(MIMEText('Thanks'))
+        with self.assertRaises(ValueError):
+            message.send()
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    @override_settings(EMAIL_DELIVERY_BACKEND='accounts.tests.UnreachableBackend', EMAIL_QUEUE_MAX_ATTEMPTS=2)
+    def test_failed_sends_back_off_then_give_up(self):
+        self.queue()
+        self.assertEqual(send_queued_emails(), (0, 1))
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.PENDING, 1))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertIn('mail server is down', email.last_error)
+
+        self.assertEqual(send_queued_emails(), (0, 0))  # not due yet
+        OutboundEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        send_queued_emails()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.FAILED, 2))
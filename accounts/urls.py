@@ -1,5 +1,5 @@
 from django.urls import path, include
-from accounts.views import UserCreateAPIView, ProfileAPIView
+from accounts.views import UserCreateAPIView, ProfileAPIView, TokenRefreshView
 from dj_rest_auth.views import LoginView, LogoutView
 from dj_rest_auth.registration.views import (RegisterView,
                                              ConfirmEmailView, ResendEmailVerificationView, VerifyEmailView
@@ -11,6 +11,7 @@ urlpatterns = [
     # path('user/', UserCreateAPIView.as_view(), name='user-create'),
     path('login/', LoginView.as_view(), name='rest_login'),
     path('logout/', LogoutView.as_view(), name='rest_logout'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('register/', UserCreateAPIView.as_view(), name='rest_register'),
     path('user/profile/<int:pk>/', ProfileAPIView.as_view(), name='user_profile'),
 ]
\ No newline at end of file
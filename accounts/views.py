@@ -8,12 +8,13 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from accounts.authentication import CachedJWTAuthentication
 from dj_rest_auth.registration.views import RegisterView
+from dj_rest_auth.jwt_auth import get_refresh_view
 from allauth.account.utils import send_email_confirmation
 from accounts.models import Profile
 from accounts.serializers import (
-    CustomUserSerializer, UserProfileSerializer, UserDetailsSerializer
+    CustomUserSerializer, UserProfileSerializer, UserDetailsSerializer, CachedTokenRefreshSerializer
 )
 from accounts.permissions import IsOwnerOrReadonly
 from django.contrib.auth import get_user_model
@@ -43,5 +44,9 @@ class UserCreateAPIView(RegisterView):
 class ProfileAPIView(generics.RetrieveUpdateAPIView):
     queryset = Profile.objects.all()
     serializer_class = UserDetailsSerializer
-    authentication_classes = [JWTAuthentication]
-    permission_classes = [IsOwnerOrReadonly]
\ No newline at end of file
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsOwnerOrReadonly]
+
+
+class TokenRefreshView(get_refresh_view()):
+    serializer_class = CachedTokenRefreshSerializer
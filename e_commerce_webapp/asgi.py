@@ -2,6 +2,8 @@
 ASGI config for e_commerce_webapp project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Async views such as ``api/products/checkout/async/`` run on the server's event loop
+when served through it (e.g. ``uvicorn e_commerce_webapp.asgi:application``).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
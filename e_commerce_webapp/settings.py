@@ -60,6 +60,8 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'products.instrumentation.QueryInstrumentationMiddleware',  # no-op unless REQUEST_INSTRUMENTATION
+    'products.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -98,6 +100,14 @@ DATABASES = {
     'default': { 
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / "db.sqlite3",
+        # take the write lock at BEGIN so concurrent writers (e.g. the Stripe event workers) queue instead of deadlocking
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # file-backed test database: the in-memory one can't serve concurrent writers (checkout stress test)
+        'TEST': {
+            'NAME': BASE_DIR / "test_db.sqlite3",
+        },
         } 
     # 'default': {
     #     'ENGINE': 'django.db.backends.postgresql',
@@ -112,12 +122,12 @@ DATABASES = {
 REST_FRAMEWORK = {
 
     'DEFAULT_RENDERER_CLASSES': (
-            'rest_framework.renderers.JSONRenderer',
+            'products.renderers.FastJSONRenderer',  # orjson when installed, same output as JSONRenderer
     ),
 
     # JWT-Authentication
-    'DEFAULT_AUTHENTICATION_CLASS': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'accounts.authentication.CachedJWTAuthentication',
         # 'dj_rest_auth.jwt_auth.JWTCookieAuthentication',
     ],
 
@@ -127,6 +137,52 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Cache
+# locmem by default (per process); set REDIS_URL to share the cache between workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'e-commerce',
+    },
+}
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL'),
+    }
+
+# category/subcategory tree cache
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+# product list facets (`?facets=1`): exclusive upper bounds of the price buckets, and how long counts are cached
+PRODUCT_PRICE_BUCKETS = [500, 1000, 5000, 10000, 50000]
+FACET_CACHE_TIMEOUT = 60 * 10
+
+# cart storage: 'db' writes every change to CartItem; 'kv' keeps carts as hashes in Redis (CART_STORE_URL)
+# or, without a URL, in process memory, and writes them behind to CartItem (see products.carts)
+CART_STORE = os.environ.get('CART_STORE', 'db')
+CART_STORE_URL = os.environ.get('CART_STORE_URL')
+CART_TTL = 60 * 60 * 24 * 30
+GUEST_CART_TTL = 60 * 60 * 24 * 7
+CART_FLUSH_INTERVAL = 5  # seconds between inline write-behind flushes; None leaves it to `manage.py flush_carts`
+
+# cursor pagination (product catalogue, order history, ratings)
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+# rows read and serialized per chunk when a list is streamed (products.mixins.StreamingListMixin)
+API_STREAM_CHUNK_SIZE = 1000
+
+# response compression (products.compression.CompressionMiddleware): brotli if installed, else gzip
+COMPRESSION_MIN_SIZE = 1024  # bytes; smaller bodies gain less than the Content-Encoding costs
+COMPRESSION_CONTENT_TYPES = ['application/json', 'text/']
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+
+# per-request query/latency instrumentation, see products.instrumentation
+REQUEST_INSTRUMENTATION = os.environ.get('REQUEST_INSTRUMENTATION') == '1'
+REQUEST_INSTRUMENTATION_LOG = os.environ.get('REQUEST_INSTRUMENTATION_LOG')  # JSONL file, one line per request
+REQUEST_INSTRUMENTATION_DUPLICATE_THRESHOLD = 3  # same query this many times in one request = likely N+1
+
 # dj-rest-auth
 REST_AUTH = {
     'REGISTER_SERIALIZER': 'accounts.serializers.CustomUserSerializer',
@@ -148,7 +204,8 @@ ACCOUNT_EMAIL_VERIFICATION = "none"
 ACCOUNT_CONFIRM_EMAIL_ON_GET = True
 
 # Django SMTP
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+# mail is queued in the OutboundEmail outbox and sent by `manage.py send_queued_emails --loop`
+EMAIL_BACKEND = "accounts.mail.QueuedEmailBackend"
 EMAIL_HOST = "smtp.gmail.com"
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -159,6 +216,16 @@ EMAIL_HOST_PASSWORD = os.environ.get('APP_PASSWORD')
 
 DEFAULT_FROM_EMAIL = os.environ.get('FROM_EMAIL')
 
+# how the outbox worker actually sends; without SMTP credentials mail is printed to the console
+EMAIL_DELIVERY_BACKEND = os.environ.get('EMAIL_DELIVERY_BACKEND') or (
+    "django.core.mail.backends.smtp.EmailBackend" if EMAIL_HOST_USER
+    else "django.core.mail.backends.console.EmailBackend"
+)
+EMAIL_QUEUE_MAX_ATTEMPTS = 6
+EMAIL_QUEUE_RETRY_DELAY = 30  # seconds before the first retry, doubled on each further failure
+EMAIL_QUEUE_MAX_RETRY_DELAY = 60 * 60
+EMAIL_QUEUE_CLAIM_TIMEOUT = 5 * 60  # an email claimed by a worker that died is retried after this
+
 
 # JWT-Authentication
 SIMPLE_JWT = {
@@ -168,13 +235,32 @@ SIMPLE_JWT = {
     # logout
     'REFRESH_TOKEN_LIFETIME': timedelta(days=10),
     'ROTATE_REFRESH_TOKENS': True,
-    'BLACKLIST_AFTER_ROTATION': True
+    'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.CachedTokenRefreshSerializer',
 }
 
+# request.user cache behind accounts.authentication.CachedJWTAuthentication
+AUTH_USER_CACHE_ALIAS = 'default'
+# the shared tier only helps (and is only safe) when the cache is shared between processes
+AUTH_USER_CACHE_TIMEOUT = 60 * 5 if os.environ.get('REDIS_URL') else 0
+AUTH_USER_LOCAL_CACHE_TTL = 5  # seconds another process may serve a stale role/is_active/is_staff
+AUTH_USER_LOCAL_CACHE_SIZE = 10000
+# clean refresh-token blacklist lookups are only safe to cache when the cache is shared between processes
+AUTH_BLACKLIST_CACHE_TIMEOUT = 60 if os.environ.get('REDIS_URL') else 0
+
 # payment
 STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY')
 STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
 STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
+STRIPE_API_BASE = os.environ.get('STRIPE_API_BASE')  # e.g. a local fake Stripe server; None = api.stripe.com
+STRIPE_TIMEOUT = 10  # seconds, per request
+STRIPE_CONNECT_TIMEOUT = 3
+STRIPE_MAX_NETWORK_RETRIES = 2  # retried with jittered exponential backoff by the stripe client
+STRIPE_EVENT_CLAIM_TIMEOUT = 5 * 60  # a webhook event claimed by a worker that died is applied again after this
+
+# stock is held for this long after checkout; the Stripe Checkout Session expires at the same time
+# (Stripe accepts 30 minutes to 24 hours) and `manage.py expire_reservations` returns unpaid stock
+STOCK_RESERVATION_TTL = timedelta(minutes=60)
 print(STRIPE_PUBLISHABLE_KEY)
 
 # Password validation
@@ -218,6 +304,27 @@ STATIC_URL = 'static/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    # product uploads are deduplicated by content hash, see utils.storage
+    'product_images': {
+        'BACKEND': 'utils.storage.ContentAddressedStorage',
+    },
+}
+
+# product image derivatives, written next to the original by a process pool
+PRODUCT_IMAGE_VARIANTS = {
+    'thumbnail': (200, 200),
+    'medium': (800, 800),
+}
+PRODUCT_IMAGE_FORMATS = ['webp', 'avif']  # avif is skipped when Pillow was built without it
+PRODUCT_IMAGE_WORKERS = 2  # 0 builds derivatives inline
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
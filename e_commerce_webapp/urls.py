@@ -15,14 +15,18 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from dj_rest_auth.registration.views import (RegisterView,
                                              ConfirmEmailView, ResendEmailVerificationView, VerifyEmailView
                                              )
+from accounts.views import TokenRefreshView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # ahead of dj_rest_auth.urls so its refresh endpoint uses the cached blacklist check
+    re_path(r'^dj-rest-auth/token/refresh/?$', TokenRefreshView.as_view(), name='cached_token_refresh'),
     path('dj-rest-auth/', include('dj_rest_auth.urls')),
     path('account-confirm-email/<str:key>/', ConfirmEmailView.as_view(), name='account_confirm_email'),
     path('dj-rest-auth/registration/', include('dj_rest_auth.registration.urls'), name='dj_rest_auth'),
@@ -0,0 +1,152 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from products.models import DailyProductSales, DailySellerSales, Order, OrderItem
+
+MEASURES = ('orders', 'units', 'revenue', 'cancelled_orders', 'cancelled_units', 'cancelled_revenue')
+BATCH_SIZE = 200
+
+
+def _deltas(order_ids, prefix='', sign=1):
+    """Per-(day, product) and per-(day, seller) increments for the lines of `order_ids`."""
+    products, sellers = defaultdict(Counter), defaultdict(Counter)
+    product_rows, seen = {}, set()
+    # lines of deleted products have no product (and no rollup rows) left to count against
+    lines = OrderItem.objects.filter(order_id__in=list(order_ids), product__isnull=False).values_list(
+        'order_id', 'order__created_at', 'product_id', 'product__user_id', 'product__category_id', 'quantity', 'price'
+    )
+    for order_id, created_at, product_id, seller_id, category_id, quantity, price in lines:
+        day = timezone.localdate(created_at)
+        product_rows[product_id] = {'seller_id': seller_id, 'category_id': category_id}
+        for counts in (products[day, product_id], sellers[day, seller_id]):
+            counts[prefix + 'units'] += sign * quantity
+            counts[prefix + 'revenue'] += sign * quantity * price
+        products[day, product_id][prefix + 'orders'] += sign
+        if (order_id, seller_id) not in seen:  # an order with several of a seller's products counts once
+            seen.add((order_id, seller_id))
+            sellers[day, seller_id][prefix + 'orders'] += sign
+    return products, product_rows, sellers
+
+
+def _increment(model, key_field, deltas, create_fields=None):
+    """
+    Add `deltas` ({(date, key): Counter}) to the rollup rows: missing rows are inserted empty
+    (concurrent inserts are ignored), then every row is incremented in one UPDATE per batch.
+    """
+    keys = list(deltas)
+    for start in range(0, len(keys), BATCH_SIZE):
+        batch = keys[start:start + BATCH_SIZE]
+        model.objects.bulk_create([
+            model(date=day, **{key_field: key}, **(create_fields or {}).get(key, {})) for day, key in batch
+        ], ignore_conflicts=True)
+
+        condition = Q()
+        for day, key in batch:
+            condition |= Q(date=day, **{key_field: key})
+        updates = {}
+        for measure in MEASURES:
+            whens = [When(Q(date=day, **{key_field: key}), then=F(measure) + deltas[day, key][measure])
+                     for day, key in batch if deltas[day, key][measure]]
+            if whens:
+                updates[measure] = Case(*whens, default=F(measure), output_field=model._meta.get_field(measure))
+        if updates:
+            model.objects.filter(condition).update(**updates)
+
+
+def _write(order_ids, prefix='', sign=1):
+    products, product_rows, sellers = _deltas(order_ids, prefix, sign)
+    with transaction.atomic():
+        _increment(DailyProductSales, 'product_id', products, product_rows)
+        _increment(DailySellerSales, 'seller_id', sellers)
+
+
+def _apply(order_ids, prefix='', sign=1):
+    # written once the caller's transaction commits, so checkouts for the same seller and day don't
+    # queue behind one rollup row for the rest of their transaction. A failed write is logged and
+    # skipped; `manage.py rebuild_sales_rollups --since` repairs the affected days.
+    order_ids = list(order_ids)
+    if order_ids:
+        transaction.on_commit(lambda: _write(order_ids, prefix, sign), robust=True)
+
+
+def record_orders(order_ids):
+    """New orders: count their lines on the day they were placed. Call once, from the checkout transaction."""
+    _apply(order_ids)
+
+
+def record_status_change(order_ids, old_status, new_status):
+    """
+    Orders moved from `old_status` to `new_status`. Only entering or leaving CANCELLED changes the
+    rollups, so callers must pass orders that really made the transition (a conditional UPDATE).
+    """
+    if new_status == Order.CANCELLED and old_status != Order.CANCELLED:
+        _apply(order_ids, prefix='cancelled_')
+    elif old_status == Order.CANCELLED and new_status != Order.CANCELLED:
+        _apply(order_ids, prefix='cancelled_', sign=-1)
+
+
+def _rollup_values(items, *group_by, distinct_orders=False):
+    cancelled = Q(order__status=Order.CANCELLED)
+    revenue = F('quantity') * F('price')
+    return items.values(*group_by).annotate(
+        orders_=Count('order', distinct=distinct_orders),
+        units_=Sum('quantity'),
+        revenue_=Sum(revenue),
+        cancelled_orders_=Count('order', distinct=distinct_orders, filter=cancelled),
+        cancelled_units_=Coalesce(Sum('quantity', filter=cancelled), Value(0)),
+        cancelled_revenue_=Coalesce(Sum(revenue, filter=cancelled), Value(0)),
+    ).order_by()
+
+
+def rebuild_rollups(since=None):
+    """
+    Recompute the rollups from order items with two GROUP BY queries, for every day or for days
+    from `since` on. Returns (product rows, seller rows) written.
+    """
+    items = OrderItem.objects.filter(product__isnull=False).annotate(day=TruncDate('order__created_at'))
+    product_rows, seller_rows = DailyProductSales.objects.all(), DailySellerSales.objects.all()
+    if since:
+        items = items.filter(day__gte=since)
+        product_rows, seller_rows = product_rows.filter(date__gte=since), seller_rows.filter(date__gte=since)
+
+    def measures(row):
+        return {measure: row[measure + '_'] for measure in MEASURES}
+
+    with transaction.atomic():
+        product_rows.delete()
+        seller_rows.delete()
+        products = DailyProductSales.objects.bulk_create([
+            DailyProductSales(date=row['day'], product_id=row['product_id'], seller_id=row['product__user_id'],
+                              category_id=row['product__category_id'], **measures(row))
+            for row in _rollup_values(items, 'day', 'product_id', 'product__user_id', 'product__category_id')
+        ], batch_size=1000)
+        sellers = DailySellerSales.objects.bulk_create([
+            DailySellerSales(date=row['day'], seller_id=row['product__user_id'], **measures(row))
+            for row in _rollup_values(items, 'day', 'product__user_id', distinct_orders=True)
+        ], batch_size=1000)
+    return len(products), len(sellers)
+
+
+SALES_GROUPS = ('day', 'product', 'category')
+
+
+def seller_sales(seller, start, end, group='day'):
+    """
+    A seller's sales for the days `start`..`end` (inclusive), per day, product or category.
+    Days come from the one-row-per-day seller rollup; breakdowns sum the seller's product rows.
+    """
+    days = DailySellerSales.objects.filter(seller=seller, date__range=(start, end))
+    totals = days.aggregate(**{measure: Coalesce(Sum(measure), Value(0)) for measure in MEASURES})
+    if group == 'day':
+        rows = days.values('date', *MEASURES).order_by('date')
+    else:
+        fields = ('product_id', 'product__name') if group == 'product' else ('category_id', 'category__name')
+        rows = (DailyProductSales.objects.filter(seller=seller, date__range=(start, end))
+                .values(*fields).annotate(**{measure + '_': Sum(measure) for measure in MEASURES})
+                .order_by('-revenue_', fields[0]))
+        rows = [{'id': row[fields[0]], 'name': row[fields[1]],
+                 **{measure: row[measure + '_'] for measure in MEASURES}} for row in rows]
+    return {'start': start, 'end': end, 'group': group, 'totals': totals, 'rows': list(rows)}
@@ -0,0 +1,202 @@
+import contextlib
+import json
+import math
+import random
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from products.models import (Category, Subcategory, Product, Rating,
+                             CartItem, Order, OrderItem, Wishlist)
+
+User = get_user_model()
+
+ADJECTIVES = ['red', 'blue', 'smart', 'classic', 'wireless', 'portable', 'premium', 'compact', 'organic', 'vintage',
+              'digital', 'ultra', 'silent', 'rugged', 'slim', 'heavy', 'bright', 'cotton', 'leather', 'steel']
+NOUNS = ['phone', 'laptop', 'headphones', 'speaker', 'watch', 'camera', 'kettle', 'chair', 'lamp', 'backpack',
+         'jacket', 'sneakers', 'blender', 'monitor', 'keyboard', 'mouse', 'tablet', 'charger', 'bottle', 'desk']
+CATEGORIES = ['electronics', 'mobiles', 'fashion', 'home', 'kitchen', 'sports', 'books', 'toys', 'beauty', 'garden']
+
+
+@contextlib.contextmanager
+def isolated_database():
+    """Run against a throwaway test database so benchmarks never touch real data."""
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def measure(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def get_seller():
+    seller, _ = User.objects.get_or_create(
+        email='bench-seller@example.com',
+        defaults={'username': 'bench-seller', 'role': 'seller', 'first_name': 'Bench', 'last_name': 'Seller'},
+    )
+    return seller
+
+
+def seed_catalogue(products, categories=len(CATEGORIES), subcategories_per_category=5, batch_size=5000, seed=0):
+    """Top the catalogue up to `products` rows (bulk inserts, so signals and the search index are skipped)."""
+    rng = random.Random(seed)
+    seller = get_seller()
+
+    for name in CATEGORIES[:categories]:
+        category, _ = Category.objects.get_or_create(name=name)
+        for index in range(subcategories_per_category):
+            Subcategory.objects.get_or_create(category=category, name=f"{name} {NOUNS[index % len(NOUNS)]}")
+    subcategories = list(Subcategory.objects.values_list('id', 'category_id'))
+
+    existing = Product.objects.count()
+    for start in range(existing, products, batch_size):
+        batch = []
+        for index in range(start, min(start + batch_size, products)):
+            subcategory_id, category_id = rng.choice(subcategories)
+            batch.append(Product(
+                name=f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {index}",
+                user=seller, category_id=category_id, subcategory_id=subcategory_id,
+                price=rng.randint(100, 100000), available_quantity=rng.randint(0, 500),
+            ))
+        Product.objects.bulk_create(batch)
+    return seller
+
+
+def seed_users(count, prefix='bench-buyer', role='buyer'):
+    """Create up to `count` users sharing one unusable password hash (hashing per user would dominate seeding)."""
+    existing = User.objects.filter(username__startswith=f'{prefix}-').count()
+    password = make_password(None)
+    User.objects.bulk_create([
+        User(email=f'{prefix}-{index}@example.com', username=f'{prefix}-{index}', role=role,
+             first_name='Bench', last_name=str(index), password=password)
+        for index in range(existing, count)
+    ])
+    return list(User.objects.filter(username__startswith=f'{prefix}-').order_by('id')[:count])
+
+
+def seed_activity(users, ratings=5, cart_items=3, wishlist=5, orders=3, items_per_order=3, seed=0):
+    """Per user: ratings, cart lines, wishlist entries and past orders over random catalogue products."""
+    rng = random.Random(seed)
+    products = Product.objects.only('id', 'name', 'price', 'image').in_bulk()
+    product_ids = list(products)
+    rating_rows, cart_rows, wishlist_rows, order_rows = [], [], [], []
+
+    for user in users:
+        picks = rng.sample(product_ids, min(len(product_ids), max(ratings, cart_items, wishlist)))
+        rating_rows += [Rating(user=user, product_id=pk, rating=rng.randint(1, 5)) for pk in picks[:ratings]]
+        cart_rows += [CartItem(user=user, product_id=pk, quantity=rng.randint(1, 3)) for pk in picks[:cart_items]]
+        wishlist_rows += [Wishlist(user=user, product_id=pk) for pk in picks[:wishlist]]
+        for _ in range(orders):
+            lines = [(pk, rng.randint(1, 3)) for pk in rng.sample(product_ids, min(len(product_ids), items_per_order))]
+            order = Order(user=user, status=Order.CHECKOUT, payment_status='completed',
+                          total_price=sum(products[pk].price * quantity for pk, quantity in lines))
+            order_rows.append((order, lines))
+
+    Rating.objects.bulk_create(rating_rows, batch_size=5000)
+    CartItem.objects.bulk_create(cart_rows, batch_size=5000, ignore_conflicts=True)
+    Wishlist.objects.bulk_create(wishlist_rows, batch_size=5000, ignore_conflicts=True)
+    Order.objects.bulk_create([order for order, _ in order_rows], batch_size=5000)
+    OrderItem.objects.bulk_create([
+        OrderItem.from_product(products[pk], order=order, quantity=quantity)
+        for order, lines in order_rows for pk, quantity in lines
+    ], batch_size=5000)
+    Product.objects.rebuild_rating_aggregates()
+
+
+def seed_lists(buyer, size, items_per_order=3):
+    """`size` products, cart lines and orders (`items_per_order` lines each) for `buyer`."""
+    seed_catalogue(size)
+    products = list(Product.objects.order_by('id')[:size])
+    CartItem.objects.bulk_create([CartItem(user=buyer, product=product, quantity=1) for product in products],
+                                 ignore_conflicts=True)
+    existing = Order.objects.filter(user=buyer).count()
+    orders = Order.objects.bulk_create([Order(user=buyer, total_price=0, status=Order.CHECKOUT)
+                                        for _ in range(existing, size)])
+    OrderItem.objects.bulk_create([
+        OrderItem.from_product(products[(index + line) % len(products)], order=order, quantity=1)
+        for index, order in enumerate(orders) for line in range(items_per_order)
+    ], batch_size=5000)
+
+
+class FakeStripeServer:
+    """Minimal local stand-in for api.stripe.com that answers Checkout Session creation."""
+
+    def __init__(self, failures=0):
+        self.requests = []
+        self.failures = failures
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+                server.requests.append((self.path, parse_qs(body)))
+                if server.failures:
+                    server.failures -= 1
+                    return self.respond(503, {'error': {'type': 'api_error', 'message': 'try again'}})
+                session_id = f'cs_test_{len(server.requests)}'
+                self.respond(200, {'id': session_id, 'object': 'checkout.session',
+                                   'url': f'https://checkout.stripe.test/{session_id}'})
+
+            def respond(self, status_code, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.httpd.server_address[1]}'
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def write_results(path, results):
+    with open(path, 'w') as output:
+        json.dump(results, output, indent=2)
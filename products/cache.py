@@ -0,0 +1,79 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+# bumped on every Category/Subcategory write; every cached catalogue entry is namespaced by it, so
+# one write invalidates the tree and all filtered subcategory lists at once
+VERSION_KEY = 'catalog:version'
+# bumped on every product write; namespaces the cached facet counts (products.facets)
+FACET_VERSION_KEY = 'facets:version'
+
+
+def get_catalog_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _get_version(key):
+    cache = get_catalog_cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time()), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    # never move backwards, so Last-Modified keeps increasing even for writes within the same second
+    version = max(int(time.time()), _get_version(key) + 1)
+    get_catalog_cache().set(key, version, timeout=None)
+
+
+def get_catalog_version():
+    return _get_version(VERSION_KEY)
+
+
+def invalidate_catalog():
+    _bump_version(VERSION_KEY)
+
+
+def get_facet_version():
+    return _get_version(FACET_VERSION_KEY)
+
+
+def invalidate_facets():
+    _bump_version(FACET_VERSION_KEY)
+
+
+def get_cached_catalog(key, build):
+    """Return {'data', 'etag', 'last_modified'} for `key`, calling `build()` only on a cache miss."""
+    version = get_catalog_version()
+    cache_key = f'catalog:{version}:{key}'
+    cache = get_catalog_cache()
+
+    entry = cache.get(cache_key)
+    if entry is None:
+        data = build()
+        body = json.dumps(data, cls=JSONEncoder, sort_keys=True).encode()
+        entry = {
+            'data': data,
+            'etag': f'"{hashlib.md5(body).hexdigest()}"',
+            'last_modified': version,
+        }
+        cache.set(cache_key, entry, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60 * 24))
+    return entry
+
+
+def conditional_catalog_response(request, entry):
+    response = get_conditional_response(request, etag=entry['etag'], last_modified=entry['last_modified'])
+    if response is None:
+        response = Response(entry['data'])
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    return response
@@ -0,0 +1,326 @@
+import functools
+import re
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.dispatch import receiver
+from products.models import CartItem, Product
+
+GUEST_CART_HEADER = 'X-Cart-Token'
+_GUEST_TOKEN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+def new_guest_token():
+    return secrets.token_urlsafe(24)
+
+
+def is_guest_token(value):
+    return bool(value and _GUEST_TOKEN.match(value))
+
+
+class GuestCartsUnsupported(Exception):
+    pass
+
+
+class DatabaseCartStore:
+    """Every change is written straight to CartItem, using atomic increments instead of read-modify-write."""
+    supports_guests = False
+
+    def _user(self, owner):
+        if isinstance(owner, str):
+            raise GuestCartsUnsupported
+        return owner
+
+    def items(self, owner):
+        return list(CartItem.objects.for_cart_display().filter(user=self._user(owner)))
+
+    def rows(self, owner, columns):
+        """The cart as `.values(*columns)` rows, product columns joined in (products.fast_serializers)."""
+        return list(CartItem.objects.filter(user=self._user(owner)).values(*columns))
+
+    def get(self, owner, product_id):
+        return CartItem.objects.for_cart_display().filter(user=self._user(owner), product_id=product_id).first()
+
+    def add(self, owner, product, quantity):
+        user = self._user(owner)
+        lookup = CartItem.objects.filter(user=user, product=product)
+        if not lookup.update(quantity=F('quantity') + quantity):
+            try:
+                with transaction.atomic():
+                    CartItem.objects.create(user=user, product=product, quantity=quantity)
+            except IntegrityError:
+                lookup.update(quantity=F('quantity') + quantity)  # a concurrent request created it first
+        return self.get(user, product.pk)
+
+    def set(self, owner, product, quantity):
+        item, _ = CartItem.objects.update_or_create(user=self._user(owner), product=product,
+                                                    defaults={'quantity': quantity})
+        return item
+
+    def remove(self, owner, product_id):
+        CartItem.objects.filter(user=self._user(owner), product_id=product_id).delete()
+
+    def clear(self, owner):
+        CartItem.objects.filter(user=self._user(owner)).delete()
+
+    def merge(self, guest_token, user):
+        pass
+
+    def flush(self, user):
+        pass
+
+    def checked_out(self, user):
+        pass  # place_order already deleted the rows
+
+
+class LocalHashClient:
+    """
+    In-process stand-in for the handful of Redis hash/set commands the cart store uses
+    (values come back as strings, like a `decode_responses=True` client). Carts live in this
+    process only, so it suits single-process deployments and development.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}
+        self.expiry = {}
+
+    def _get(self, key, default=None):
+        expires = self.expiry.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            self.expiry.pop(key, None)
+        return self.data.get(key, default)
+
+    def exists(self, key):
+        with self.lock:
+            return int(self._get(key) is not None)
+
+    def hgetall(self, key):
+        with self.lock:
+            return {field: str(value) for field, value in (self._get(key) or {}).items()}
+
+    def hget(self, key, field):
+        with self.lock:
+            value = (self._get(key) or {}).get(field)
+            return None if value is None else str(value)
+
+    def hincrby(self, key, field, amount):
+        with self.lock:
+            values = self.data[key] = self._get(key, {})
+            values[field] = int(values.get(field, 0)) + amount
+            return values[field]
+
+    def hset(self, key, field, value):
+        with self.lock:
+            self.data[key] = self._get(key, {})
+            self.data[key][field] = value
+
+    def hsetnx(self, key, field, value):
+        with self.lock:
+            values = self.data[key] = self._get(key, {})
+            return int(values.setdefault(field, value) is value)
+
+    def hdel(self, key, *fields):
+        with self.lock:
+            values = self._get(key, {})
+            return sum(values.pop(field, None) is not None for field in fields)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.data.pop(key, None)
+                self.expiry.pop(key, None)
+
+    def expire(self, key, seconds):
+        with self.lock:
+            if self._get(key) is not None:
+                self.expiry[key] = time.monotonic() + seconds
+
+    def sadd(self, key, *members):
+        with self.lock:
+            self.data.setdefault(key, set()).update(members)
+
+    def spop(self, key, count):
+        with self.lock:
+            members = self.data.get(key, set())
+            return [members.pop() for _ in range(min(count, len(members)))]
+
+
+class KeyValueCartStore:
+    """
+    Carts kept as hashes (`cart:user:<id>` / `cart:guest:<token>`, product id -> quantity) in Redis
+    or process memory. Quantities change with atomic HINCRBY and every write refreshes the TTL.
+    User carts are written behind: changed carts are marked dirty and copied to CartItem in batches
+    by `flush_dirty()` (inline every CART_FLUSH_INTERVAL seconds and from `manage.py flush_carts`),
+    and always before checkout.
+    """
+    supports_guests = True
+    dirty_key = 'cart:dirty'
+    loaded_field = '__loaded__'
+
+    def __init__(self, client):
+        self.client = client
+        self.flush_lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    def key(self, owner):
+        return f'cart:guest:{owner}' if isinstance(owner, str) else f'cart:user:{owner.pk}'
+
+    def _quantities(self, owner):
+        return {int(field): int(value) for field, value in self._load(owner).items()
+                if field != self.loaded_field and int(value) > 0}
+
+    def _load(self, owner):
+        """A user's cart is seeded from CartItem the first time (or after it expired) it is touched."""
+        key = self.key(owner)
+        values = self.client.hgetall(key)
+        if values or isinstance(owner, str):
+            return values
+        for product_id, quantity in CartItem.objects.filter(user=owner).values_list('product_id', 'quantity'):
+            self.client.hsetnx(key, str(product_id), quantity)  # never overwrite a concurrent increment
+        self.client.hsetnx(key, self.loaded_field, 1)
+        self._touch(owner)
+        return self.client.hgetall(key)
+
+    def _touch(self, owner, dirty=False):
+        ttl = settings.GUEST_CART_TTL if isinstance(owner, str) else settings.CART_TTL
+        self.client.expire(self.key(owner), ttl)
+        if dirty and not isinstance(owner, str):
+            self.client.sadd(self.dirty_key, str(owner.pk))
+            self.maybe_flush()
+
+    def _item(self, owner, product, quantity):
+        return CartItem(user=None if isinstance(owner, str) else owner, product=product, quantity=quantity)
+
+    def items(self, owner):
+        quantities = self._quantities(owner)
+        products = Product.objects.in_bulk(list(quantities))
+        return [self._item(owner, products[pk], quantity) for pk, quantity in quantities.items() if pk in products]
+
+    def rows(self, owner, columns):
+        quantities = self._quantities(owner)
+        product_columns = {column: column.removeprefix('product__') for column in columns
+                           if column.startswith('product__')}
+        products = {row['id']: row for row in
+                    Product.objects.filter(pk__in=list(quantities)).values('id', *set(product_columns.values()))}
+        return [{'product_id': pk, 'quantity': quantity,
+                 **{column: products[pk][name] for column, name in product_columns.items()}}
+                for pk, quantity in quantities.items() if pk in products]
+
+    def get(self, owner, product_id):
+        quantity = self._quantities(owner).get(int(product_id))
+        product = Product.objects.filter(pk=product_id).first() if quantity else None
+        return self._item(owner, product, quantity) if product else None
+
+    def add(self, owner, product, quantity):
+        self._load(owner)
+        total = self.client.hincrby(self.key(owner), str(product.pk), quantity)
+        self._touch(owner, dirty=True)
+        return self._item(owner, product, total)
+
+    def set(self, owner, product, quantity):
+        self._load(owner)
+        self.client.hset(self.key(owner), str(product.pk), quantity)
+        self._touch(owner, dirty=True)
+        return self._item(owner, product, quantity)
+
+    def remove(self, owner, product_id):
+        self._load(owner)
+        self.client.hdel(self.key(owner), str(product_id))
+        self._touch(owner, dirty=True)
+
+    def clear(self, owner):
+        self.client.delete(self.key(owner))
+        if not isinstance(owner, str):
+            self.client.hset(self.key(owner), self.loaded_field, 1)  # known-empty, don't reseed from CartItem
+            self._touch(owner, dirty=True)
+
+    def merge(self, guest_token, user):
+        guest = self.client.hgetall(self.key(guest_token))
+        if not guest:
+            return
+        self._load(user)
+        for field, value in guest.items():
+            self.client.hincrby(self.key(user), field, int(value))
+        self.client.delete(self.key(guest_token))
+        self._touch(user, dirty=True)
+
+    def flush(self, user):
+        self._flush_users([user.pk])
+
+    def checked_out(self, user):
+        self.client.delete(self.key(user))  # reseeded from the (now empty) CartItem rows on next use
+
+    def maybe_flush(self):
+        interval = settings.CART_FLUSH_INTERVAL
+        if interval is None or time.monotonic() - self.last_flush < interval:
+            return
+        if self.flush_lock.acquire(blocking=False):
+            try:
+                self.last_flush = time.monotonic()
+                self.flush_dirty()
+            finally:
+                self.flush_lock.release()
+
+    def flush_dirty(self, batch_size=500):
+        """Copy every dirty user cart to CartItem, `batch_size` users per transaction."""
+        flushed = 0
+        while user_ids := [int(pk) for pk in self.client.spop(self.dirty_key, batch_size)]:
+            self._flush_users(user_ids)
+            flushed += len(user_ids)
+        return flushed
+
+    def _flush_users(self, user_ids):
+        carts = {}
+        for user_id in user_ids:
+            values = self.client.hgetall(f'cart:user:{user_id}')
+            if values:  # an expired cart was never reloaded, CartItem still holds it
+                carts[user_id] = {int(field): int(value) for field, value in values.items()
+                                  if field != self.loaded_field and int(value) > 0}
+        if not carts:
+            return
+        live = set(Product.objects.filter(
+            pk__in={pk for quantities in carts.values() for pk in quantities}).values_list('pk', flat=True))
+
+        stale = Q()
+        for user_id, quantities in carts.items():
+            stale |= Q(user_id=user_id) & ~Q(product_id__in=list(quantities))
+        with transaction.atomic():
+            CartItem.objects.filter(stale).delete()
+            CartItem.objects.bulk_create(
+                [CartItem(user_id=user_id, product_id=pk, quantity=quantity)
+                 for user_id, quantities in carts.items() for pk, quantity in quantities.items() if pk in live],
+                update_conflicts=True, unique_fields=['user', 'product'], update_fields=['quantity'],
+            )
+
+
+def _kv_client():
+    if not settings.CART_STORE_URL:
+        return LocalHashClient()
+    try:
+        import redis
+    except ImportError:
+        raise ImproperlyConfigured("CART_STORE_URL is set but the redis package is not installed")
+    return redis.Redis.from_url(settings.CART_STORE_URL, decode_responses=True)
+
+
+@functools.lru_cache(maxsize=None)
+def get_cart_store():
+    if settings.CART_STORE == 'db':
+        return DatabaseCartStore()
+    if settings.CART_STORE == 'kv':
+        return KeyValueCartStore(_kv_client())
+    raise ImproperlyConfigured(f"Unknown CART_STORE {settings.CART_STORE!r}, expected 'db' or 'kv'")
+
+
+@receiver(setting_changed)
+def reset_cart_store(setting, **kwargs):
+    if setting.startswith('CART_STORE'):
+        get_cart_store.cache_clear()
@@ -0,0 +1,164 @@
+import codecs
+import csv
+import itertools
+import json
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from products.cache import invalidate_facets
+from products.models import Category, Subcategory, Product
+from products.search import index_products
+from products.serializers import ProductImportSerializer
+
+FORMATS = ('csv', 'jsonl')
+COLUMNS = ['name', 'description', 'price', 'available_quantity', 'category', 'subcategory']
+# columns a row may leave out (or blank); on update the product keeps its current value for them
+OPTIONAL_COLUMNS = ['description', 'available_quantity']
+UPDATE_FIELDS = ['description', 'price', 'available_quantity', 'category', 'subcategory', 'version', 'updated_at']
+
+
+def guess_format(filename, default='csv'):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return {'jsonl': 'jsonl', 'ndjson': 'jsonl', 'csv': 'csv'}.get(extension, default)
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict) from a binary stream, one line at a time."""
+    lines = codecs.getreader('utf-8-sig')(stream)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else {'__invalid__': line}
+
+
+class CatalogueImport:
+    """
+    Validates rows in batches and writes them with bulk_create/bulk_update: category and subcategory
+    names are resolved once up front and name uniqueness is checked with one query per batch
+    instead of one `exists()` per row.
+    """
+
+    def __init__(self, seller, batch_size=1000, update=False):
+        self.seller = seller
+        self.batch_size = batch_size
+        self.update = update
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+        self.seen_names = set()
+        self.categories = {}
+        for pk, name in Category.objects.order_by('-pk').values_list('id', 'name'):
+            self.categories[name.strip().lower()] = pk  # lowest id wins for duplicate names
+        self.subcategories = {}
+        for pk, category_id, name in Subcategory.objects.order_by('-pk').values_list('id', 'category_id', 'name'):
+            self.subcategories[category_id, name.strip().lower()] = pk
+
+    def run(self, rows):
+        rows = iter(rows)
+        while batch := list(itertools.islice(rows, self.batch_size)):
+            self.import_batch(batch)
+        return self.summary()
+
+    def summary(self):
+        return {'created': self.created, 'updated': self.updated, 'error_count': len(self.errors),
+                'errors': sorted(self.errors, key=lambda error: error['line'])[:100]}
+
+    def error(self, line, errors):
+        self.errors.append({'line': line, 'errors': errors})
+
+    def resolve(self, line, data):
+        category_id = self.categories.get(data['category'].strip().lower())
+        if category_id is None:
+            return self.error(line, {'category': [f"Unknown category '{data['category']}'."]})
+        subcategory_id = self.subcategories.get((category_id, data['subcategory'].strip().lower()))
+        if subcategory_id is None:
+            return self.error(line, {'subcategory': [f"Unknown subcategory '{data['subcategory']}' "
+                                                     f"for category '{data['category']}'."]})
+        return Product(
+            user=self.seller, name=data['name'], description=data.get('description'), price=data['price'],
+            available_quantity=data.get('available_quantity'), category_id=category_id, subcategory_id=subcategory_id,
+        )
+
+    def import_batch(self, batch):
+        candidates = []
+        for line, row in batch:
+            if '__invalid__' in row:
+                self.error(line, {'non_field_errors': ["Line is not a JSON object."]})
+                continue
+            serializer = ProductImportSerializer(data=row)
+            if not serializer.is_valid():
+                self.error(line, serializer.errors)
+                continue
+            name = serializer.validated_data['name']
+            if name in self.seen_names:
+                self.error(line, {'name': ["Duplicate product name in this import."]})
+                continue
+            self.seen_names.add(name)
+            product = self.resolve(line, serializer.validated_data)
+            if product is not None:
+                missing = [column for column in OPTIONAL_COLUMNS if column not in serializer.validated_data]
+                candidates.append((line, product, missing))
+
+        existing = {
+            row['name']: row for row in
+            Product.objects.filter(name__in=[product.name for _, product, _ in candidates])
+            .values('name', 'id', 'user_id', *OPTIONAL_COLUMNS)
+        }
+        to_create, to_update = [], []
+        now = timezone.now()
+        for line, product, missing in candidates:
+            if product.name not in existing:
+                to_create.append(product)
+                continue
+            current = existing[product.name]
+            if not self.update or current['user_id'] != self.seller.pk:
+                self.error(line, {'name': ["Product with this name already exists."]})
+                continue
+            product.pk = current['id']
+            for column in missing:  # bulk_update writes every field, so carry the current value over
+                setattr(product, column, current[column])
+            product.version = F('version') + 1
+            product.updated_at = now
+            to_update.append(product)
+
+        with transaction.atomic():
+            created = Product.objects.bulk_create(to_create, batch_size=self.batch_size)
+            Product.objects.bulk_update(to_update, UPDATE_FIELDS, batch_size=self.batch_size)
+            # bulk writes skip the post_save signals that keep the search index and facet counts current
+            index_products([product.pk for product in itertools.chain(created, to_update)])
+        if created or to_update:
+            invalidate_facets()
+        self.created += len(created)
+        self.updated += len(to_update)
+
+
+class Echo:
+    """File-like object whose write() hands the value back, so csv.writer can feed a streaming response."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, fmt, chunk_size=2000):
+    """Yield the catalogue as CSV or JSONL text, reading the queryset in chunks."""
+    rows = queryset.order_by('pk').values_list(
+        'name', 'description', 'price', 'available_quantity', 'category__name', 'subcategory__name'
+    ).iterator(chunk_size=chunk_size)
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(COLUMNS)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(COLUMNS, row))) + '\n'
@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.db.models import F, Sum
+from products.analytics import record_orders
+from products.carts import get_cart_store
+from products.inventory import OutOfStock, reserve_stock
+from products.models import CartItem, Order, OrderItem
+
+
+class CheckoutError(Exception):
+    pass
+
+
+def place_order(user):
+    """
+    Turn the user's cart into an Order in one transaction: order + items, stock reservation and
+    cart clear either all happen or none do; the sales rollups follow once it commits.
+    Returns (order, cart_items).
+    """
+    store = get_cart_store()
+    store.flush(user)  # write-behind carts must reach CartItem before it is read
+
+    with transaction.atomic():
+        cart_items = list(CartItem.objects.for_checkout().filter(user=user))
+
+        if not cart_items:
+            raise CheckoutError("No items in cart")
+
+        for item in cart_items:
+            stock = item.product.available_quantity
+            if stock is not None and stock < item.quantity:
+                raise CheckoutError(f"Only {stock} of {item.product.name} left in stock")
+
+        total_price = CartItem.objects.filter(user=user).aggregate(
+            total=Sum(F('quantity') * F('product__price'))
+        )['total']
+
+        # Create an Order
+        order = Order.objects.create(user=user, total_price=total_price, status=Order.CHECKOUT)
+        OrderItem.objects.bulk_create([
+            OrderItem.from_product(item.product, order=order, quantity=item.quantity)
+            for item in cart_items
+        ])
+
+        try:
+            reserve_stock(order, [(item.product, item.quantity) for item in cart_items])
+        except OutOfStock as e:
+            raise CheckoutError(str(e))
+        record_orders([order.pk])
+
+        CartItem.objects.filter(user=user).delete()  # Empty the cart after checkout
+
+    store.checked_out(user)
+    return order, cart_items
@@ -0,0 +1,115 @@
+import gzip
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def compression_exempt(view_func):
+    """Mark a view whose responses are always tiny, so CompressionMiddleware doesn't look at them."""
+    view_func.compression_exempt = True
+    return view_func
+
+
+def available_encodings():
+    """Content codings this process can produce, best first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encoding):
+    """The best available coding the Accept-Encoding header allows (q > 0), or None for identity."""
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.partition(';')
+        weight = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding.strip():
+            weights[coding.strip().lower()] = weight
+    default = weights.get('*', 0.0)
+    candidates = [coding for coding in available_encodings() if weights.get(coding, default) > 0]
+    # ties go to the earlier (better) coding
+    return max(candidates, key=lambda coding: weights.get(coding, default), default=None)
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of byte chunks, flushing after each so a streamed body keeps streaming."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+        return
+    # wbits 16 + MAX_WBITS writes the gzip header and trailer
+    compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with brotli (when installed) or gzip, as negotiated by Accept-Encoding.
+    Only COMPRESSION_CONTENT_TYPES are touched; bodies under COMPRESSION_MIN_SIZE and views marked
+    with compression_exempt are sent as-is. Strong ETags are weakened on compressed responses, and
+    If-Match is compared with the weak prefix dropped so optimistic concurrency keeps working.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if_match = request.META.get('HTTP_IF_MATCH')
+        if if_match:
+            request.META['HTTP_IF_MATCH'] = if_match.replace('W/', '')
+        request.compression_exempt = False
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.compression_exempt = getattr(view_func, 'compression_exempt', False)
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '')
+        if (request.compression_exempt or response.has_header('Content-Encoding')
+                or (response.streaming and response.is_async)
+                or not content_type.startswith(tuple(settings.COMPRESSION_CONTENT_TYPES))):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(response.streaming_content, encoding)
+            del response['Content-Length']
+        else:
+            body = compress(response.content, encoding)
+            if len(body) >= len(response.content):
+                return response
+            response.content = body
+            response['Content-Length'] = str(len(body))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,76 @@
+import hashlib
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Case, Count, IntegerField, Value, When
+from products.cache import get_catalog_cache, get_catalog_version, get_facet_version
+from products.models import Category, Product, Subcategory
+
+# query parameters that page through a result set without changing which products are in it
+PAGING_PARAMS = ('cursor', 'page', 'page_size', 'facets')
+
+
+def price_buckets():
+    """[(min, max)] covering every price; PRODUCT_PRICE_BUCKETS are the exclusive upper bounds."""
+    bounds = [0, *settings.PRODUCT_PRICE_BUCKETS]
+    return [(low, high - 1) for low, high in zip(bounds, bounds[1:])] + [(bounds[-1], None)]
+
+
+def price_bucket_expression():
+    bounds = settings.PRODUCT_PRICE_BUCKETS
+    return Case(*[When(price__lt=bound, then=Value(index)) for index, bound in enumerate(bounds)],
+                default=Value(len(bounds)), output_field=IntegerField())
+
+
+def count_facets(queryset):
+    """
+    Category, subcategory and price-bucket counts for `queryset` from a single GROUP BY over
+    (category, subcategory, bucket); the per-dimension totals are summed from its rows.
+    """
+    if queryset.query.annotations:  # e.g. search rank, itself an aggregate: group its ids instead
+        queryset = Product.objects.filter(pk__in=queryset.values('pk'))
+    rows = (queryset.order_by().annotate(bucket=price_bucket_expression())
+            .values_list('category_id', 'subcategory_id', 'bucket').annotate(count=Count('id')))
+
+    categories, subcategories, buckets = Counter(), Counter(), Counter()
+    for category_id, subcategory_id, bucket, count in rows:
+        categories[category_id] += count
+        subcategories[subcategory_id] += count
+        buckets[bucket] += count
+
+    category_names = dict(Category.objects.filter(pk__in=list(categories)).values_list('pk', 'name'))
+    subcategory_rows = {row['id']: row for row in
+                        Subcategory.objects.filter(pk__in=list(subcategories)).values('id', 'name', 'category')}
+    return {
+        'category': [{'id': pk, 'name': category_names[pk], 'count': count}
+                     for pk, count in _most_common(categories)],
+        'subcategory': [{**subcategory_rows[pk], 'count': count} for pk, count in _most_common(subcategories)],
+        'price': [{'min': low, 'max': high, 'count': buckets[index]}
+                  for index, (low, high) in enumerate(price_buckets())],
+    }
+
+
+def _most_common(counts):
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+def facet_cache_key(query_params):
+    params = sorted((key, value) for key, values in query_params.lists() if key not in PAGING_PARAMS
+                    for value in values)
+    digest = hashlib.md5(repr(params).encode()).hexdigest()
+    return f'facets:{get_catalog_version()}:{get_facet_version()}:{digest}'
+
+
+def get_facets(queryset, query_params):
+    """
+    Facet counts for a filtered product queryset, cached per filter combination. Entries are
+    namespaced by the facet version (bumped on product writes) and the catalogue version
+    (category renames), so they never outlive the data they were counted from.
+    """
+    cache = get_catalog_cache()
+    key = facet_cache_key(query_params)
+    facets = cache.get(key)
+    if facets is None:
+        facets = count_facets(queryset)
+        cache.set(key, facets, settings.FACET_CACHE_TIMEOUT)
+    return facets
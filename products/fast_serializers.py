@@ -0,0 +1,193 @@
+import functools
+from collections import defaultdict
+
+from rest_framework import serializers
+from products.models import CartItem, Order, OrderItem, Product
+from products.serializers import image_variant_urls
+
+
+class Column:
+    """A model column copied as-is (or through `convert`, e.g. a DRF field's to_representation)."""
+
+    def __init__(self, name, convert=None):
+        self.name = name
+        self.convert = convert
+
+    def columns(self, prefix):
+        return [prefix + self.name]
+
+    def compile(self, prefix):
+        key, convert = prefix + self.name, self.convert
+        if convert is None:
+            return lambda row, request: row[key]
+        return lambda row, request: None if row[key] is None else convert(row[key])
+
+
+class Method:
+    """A value computed from one or more columns by `func(request, *values)`."""
+
+    def __init__(self, func, *names):
+        self.func = func
+        self.names = names
+
+    def columns(self, prefix):
+        return [prefix + name for name in self.names]
+
+    def compile(self, prefix):
+        keys, func = self.columns(prefix), self.func
+        return lambda row, request: func(request, *[row[key] for key in keys])
+
+
+class Nested:
+    """A to-one relation rendered by another FastSerializer from the same row (a join)."""
+
+    def __init__(self, serializer_class, relation):
+        self.serializer_class = serializer_class
+        self.relation = relation
+
+    def columns(self, prefix):
+        return self.serializer_class.plan(f'{prefix}{self.relation}__')[0]
+
+    def compile(self, prefix):
+        steps = self.serializer_class.plan(f'{prefix}{self.relation}__')[1]
+        return lambda row, request: {key: get(row, request) for key, get in steps}
+
+
+class Many:
+    """A reverse relation loaded with one extra query for the whole list and grouped on `fk`."""
+
+    def __init__(self, serializer_class, fk, ordering=('id',)):
+        self.serializer_class = serializer_class
+        self.fk = fk
+        self.ordering = ordering
+
+
+class FastSerializer:
+    """
+    Read-only serializer for list endpoints: rows come from `.values()` and each field is rendered by a
+    step compiled once per class, so there is no per-instance field binding or model instantiation.
+    Subclasses declare `fields` ({output name: Column/Method/Nested/Many}) matching the JSON of the
+    DRF serializer they stand in for; FastSerializerTests keep the two identical.
+    """
+    model = None
+    fields = {}
+
+    def __init__(self, rows=None, request=None):
+        self.rows = rows
+        self.request = request
+
+    @classmethod
+    @functools.cache
+    def plan(cls, prefix=''):
+        """(value columns, [(output name, step)]) for rows read through `prefix`."""
+        columns, steps = ['id'] if not prefix else [], []
+        for key, field in cls.fields.items():
+            if isinstance(field, Many):
+                continue  # filled in by to_representation()
+            columns += [column for column in field.columns(prefix) if column not in columns]
+            steps.append((key, field.compile(prefix)))
+        return columns, steps
+
+    @classmethod
+    def values(cls, queryset, *extra):
+        """`queryset` as the dict rows the plan reads; `extra` columns ride along (e.g. for ETags or cursors)."""
+        columns = cls.plan()[0]
+        # related rows are read by the plan itself, never prefetched onto instances
+        return queryset.prefetch_related(None).values(*columns, *[name for name in extra if name not in columns])
+
+    def to_representation(self, rows):
+        rows = list(rows)
+        steps = self.plan()[1]
+        request = self.request
+        data = [{key: get(row, request) for key, get in steps} for row in rows]
+
+        for key, field in self.fields.items():
+            if isinstance(field, Many):
+                children = field.serializer_class(request=request)
+                related = list(field.serializer_class.values(
+                    field.serializer_class.model.objects.filter(**{f'{field.fk}__in': [row['id'] for row in rows]})
+                    .order_by(*field.ordering), field.fk
+                ))
+                grouped = defaultdict(list)
+                for child_row, child in zip(related, children.to_representation(related)):
+                    grouped[child_row[field.fk]].append(child)
+                for item, row in zip(data, rows):
+                    item[key] = grouped.get(row['id'], [])
+        return data
+
+    @property
+    def data(self):
+        return self.to_representation(self.rows)
+
+
+def image_url(request, name):
+    if not name:
+        return None
+    url = Product._meta.get_field('image').storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def image_variants(request, name):
+    return image_variant_urls(name, request) if name else None
+
+
+def thumbnail(request, name):
+    return image_variant_urls(name, request).get('thumbnail') if name else None
+
+
+def average_rating(request, rating_sum, rating_count):
+    return rating_sum / rating_count if rating_count else None
+
+
+# same JSON as ProductSerializer
+class FastProductSerializer(FastSerializer):
+    model = Product
+    fields = {
+        'id': Column('id'),
+        'category': Column('category_id'),
+        'subcategory': Column('subcategory_id'),
+        'name': Column('name'),
+        'description': Column('description'),
+        'price': Column('price'),
+        'available_quantity': Column('available_quantity'),
+        'image': Method(image_url, 'image'),
+        'image_variants': Method(image_variants, 'image'),
+        'average_rating': Method(average_rating, 'rating_sum', 'rating_count'),
+        'rating_count': Column('rating_count'),
+    }
+
+
+# same JSON as CartItemSerializer; the product is joined into the cart row
+class FastCartItemSerializer(FastSerializer):
+    model = CartItem
+    fields = {
+        'product': Nested(FastProductSerializer, 'product'),
+        'product_id': Column('product_id'),
+        'quantity': Column('quantity'),
+    }
+
+
+# same JSON as OrderItemSerializer
+class FastOrderItemSerializer(FastSerializer):
+    model = OrderItem
+    fields = {
+        'order': Column('order_id'),
+        'product': Column('product_id'),
+        'product_name': Column('product_name'),
+        'quantity': Column('quantity'),
+        'price': Column('price'),
+        'thumbnail': Method(thumbnail, 'product_image'),
+    }
+
+
+# same JSON as OrderSerializer
+class FastOrderSerializer(FastSerializer):
+    model = Order
+    fields = {
+        'id': Column('id'),
+        'user': Column('user_id'),
+        'created_at': Column('created_at', serializers.DateTimeField().to_representation),
+        'total_price': Column('total_price'),
+        'status': Column('status'),
+        'order_items': Many(FastOrderItemSerializer, 'order_id'),
+    }
@@ -1,13 +1,19 @@
-from dataclasses import fields
-
 from django_filters import rest_framework as filters
-from .models import Product, CartItem
+from .models import Category, Product
+
 
 class ProductFilter(filters.FilterSet):
-    category = filters.CharFilter(field_name='category__name', lookup_expr='icontains')
-    min_price = filters.CharFilter(field_name='price', lookup_expr='gte')
-    max_price = filters.CharFilter(field_name='price', lookup_expr='lte')
+    category = filters.CharFilter(method='filter_category')
+    # ids, as returned in the facet counts (products.facets)
+    category_id = filters.NumberFilter(field_name='category_id')
+    subcategory_id = filters.NumberFilter(field_name='subcategory_id')
+    min_price = filters.NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = filters.NumberFilter(field_name='price', lookup_expr='lte')
 
+    class Meta:
+        model = Product
+        fields = ['category', 'category_id', 'subcategory_id', 'min_price', 'max_price']
 
-    model = Product
-    fields = ['category', 'min_price', 'max_price']
\ No newline at end of file
+    # match against the (small) category table first so products are filtered through the category_id index
+    def filter_category(self, queryset, name, value):
+        return queryset.filter(category__in=Category.objects.filter(name__icontains=value).values('id'))
@@ -0,0 +1,86 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_variants():
+    return getattr(settings, 'PRODUCT_IMAGE_VARIANTS', {'thumbnail': (200, 200), 'medium': (800, 800)})
+
+
+def get_formats():
+    """Configured derivative formats this Pillow build can actually write (AVIF needs Pillow >= 11.2)."""
+    Image.init()
+    return [fmt for fmt in getattr(settings, 'PRODUCT_IMAGE_FORMATS', ['webp', 'avif'])
+            if fmt.upper() in Image.SAVE]
+
+
+def derivative_name(name, variant, fmt):
+    stem, _ = os.path.splitext(name)
+    return f'{stem}_{variant}.{fmt}'
+
+
+def derivative_names(name):
+    return {
+        variant: {fmt: derivative_name(name, variant, fmt) for fmt in get_formats()}
+        for variant in get_variants()
+    }
+
+
+def build_derivatives(path, variants, formats):
+    """
+    Write every variant of the image at `path` next to it. Runs in a worker process, so it only
+    takes plain paths/settings and never touches Django. Up-to-date derivatives are skipped, and
+    the image isn't even decoded when all of them are.
+    """
+    source_mtime = os.path.getmtime(path)
+    stale = {}
+    for variant in variants:
+        for fmt in formats:
+            target = derivative_name(path, variant, fmt)
+            if not (os.path.exists(target) and os.path.getmtime(target) >= source_mtime):
+                stale.setdefault(variant, []).append((fmt, target))
+    if not stale:
+        return []
+
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+        written = []
+        for variant, targets in stale.items():
+            resized = ImageOps.fit(image, tuple(variants[variant]), Image.Resampling.LANCZOS)
+            for fmt, target in targets:
+                temporary = f'{target}.tmp'
+                resized.save(temporary, fmt.upper(), quality=80)
+                os.replace(temporary, target)
+                written.append(target)
+    return written
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=getattr(settings, 'PRODUCT_IMAGE_WORKERS', 2))
+    return _executor
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.error("Building product image derivatives failed", exc_info=future.exception())
+
+
+def schedule_derivatives(storage, name):
+    """Build derivatives for a stored image off the request thread (inline when PRODUCT_IMAGE_WORKERS = 0)."""
+    args = (storage.path(name), get_variants(), get_formats())
+    if not getattr(settings, 'PRODUCT_IMAGE_WORKERS', 2):
+        return build_derivatives(*args)
+    future = get_executor().submit(build_derivatives, *args)
+    future.add_done_callback(_log_failure)
+    return future
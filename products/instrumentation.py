@@ -0,0 +1,230 @@
+import bisect
+import contextvars
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+from products.fast_serializers import FastSerializer
+
+logger = logging.getLogger(__name__)
+
+# upper bounds (ms) of the per-route latency histogram; the last bucket is open ended
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_current = contextvars.ContextVar('request_profile', default=None)
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+
+def fingerprint(sql):
+    """SQL with literals and placeholder lists collapsed, so `WHERE id = 1` and `WHERE id = 2` match."""
+    sql = _LITERALS.sub('?', sql.replace('%s', '?'))
+    return _PLACEHOLDER_LISTS.sub('(...)', sql)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self, threshold):
+        return {sql: count for sql, count in self.fingerprints.items() if count >= threshold}
+
+
+class RouteStats:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.db_ms = 0.0
+        self.serializer_ms = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.duplicate_requests = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, record):
+        self.count += 1
+        self.total_ms += record['total_ms']
+        self.db_ms += record['db_ms']
+        self.serializer_ms += record['serializer_ms']
+        self.queries += record['queries']
+        self.max_queries = max(self.max_queries, record['queries'])
+        self.duplicate_requests += bool(record['duplicates'])
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, record['total_ms'])] += 1
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of requests (None = beyond the last bound)."""
+        target = fraction * self.count
+        seen = 0
+        for bound, hits in zip(LATENCY_BUCKETS + (None,), self.buckets):
+            seen += hits
+            if hits and seen >= target:
+                return bound
+        return None
+
+    def as_dict(self):
+        count = self.count or 1
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / count, 3),
+            'mean_db_ms': round(self.db_ms / count, 3),
+            'mean_serializer_ms': round(self.serializer_ms / count, 3),
+            'mean_queries': round(self.queries / count, 2),
+            'max_queries': self.max_queries,
+            'duplicate_query_requests': self.duplicate_requests,
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'histogram': {f'le_{bound}': hits for bound, hits in zip(LATENCY_BUCKETS, self.buckets)}
+                         | {'gt_%d' % LATENCY_BUCKETS[-1]: self.buckets[-1]},
+        }
+
+
+class RouteRegistry:
+    """Per-process aggregate of request records keyed by 'METHOD route'."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def add(self, record):
+        key = f"{record['method']} {record['route']}"
+        with self.lock:
+            self.routes.setdefault(key, RouteStats()).add(record)
+
+    def snapshot(self):
+        with self.lock:
+            return {key: stats.as_dict() for key, stats in sorted(self.routes.items())}
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+
+
+registry = RouteRegistry()
+
+
+def _timed_serializer_data(prop):
+    def data(self):
+        profile = _current.get()
+        if profile is None:
+            return prop.fget(self)
+        start = time.perf_counter()
+        try:
+            return prop.fget(self)
+        finally:
+            profile.serializer_time += time.perf_counter() - start
+    data.instrumented = True
+    return property(data)
+
+
+def instrument_serializers():
+    # Serializer.data and ListSerializer.data both delegate to BaseSerializer.data, so nesting isn't counted twice;
+    # FastSerializer nests through to_representation(), so timing its .data doesn't double count either
+    for serializer_class in (BaseSerializer, FastSerializer):
+        if not getattr(serializer_class.data.fget, 'instrumented', False):
+            serializer_class.data = _timed_serializer_data(serializer_class.data)
+
+
+def server_timing(profile, total):
+    return ', '.join([
+        f'db;dur={profile.db_time * 1000:.2f};desc="{profile.queries} queries"',
+        f'serializer;dur={profile.serializer_time * 1000:.2f}',
+        f'total;dur={total * 1000:.2f}',
+    ])
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Records query count, DB time, repeated (N+1) queries and serializer time per request,
+    adds a Server-Timing header and aggregates a latency histogram per route.
+    Removed from the middleware chain at startup unless REQUEST_INSTRUMENTATION is on.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = settings.REQUEST_INSTRUMENTATION_DUPLICATE_THRESHOLD
+        self.log_path = settings.REQUEST_INSTRUMENTATION_LOG
+        self.log_lock = threading.Lock()
+        instrument_serializers()
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        response['Server-Timing'] = server_timing(profile, total)
+        if response.streaming:
+            # the body's queries run as it is sent, after the headers: record once it is consumed
+            response.streaming_content = self.profile_stream(request, response, profile, start,
+                                                              iter(response.streaming_content))
+        else:
+            self.record(request, response, profile, total)
+        return response
+
+    def profile_stream(self, request, response, profile, start, stream):
+        try:
+            while True:
+                token = _current.set(profile)
+                try:
+                    with ExitStack() as stack:
+                        for connection in connections.all():
+                            stack.enter_context(connection.execute_wrapper(profile))
+                        chunk = next(stream, None)
+                finally:
+                    _current.reset(token)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self.record(request, response, profile, time.perf_counter() - start)
+
+    def record(self, request, response, profile, total):
+        match = request.resolver_match
+        duplicates = profile.duplicates(self.threshold)
+        record = {
+            'method': request.method,
+            'route': match.route if match else '<unresolved>',
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 3),
+            'db_ms': round(profile.db_time * 1000, 3),
+            'serializer_ms': round(profile.serializer_time * 1000, 3),
+            'queries': profile.queries,
+            'duplicates': duplicates,
+        }
+        for sql, count in duplicates.items():
+            logger.warning("%s %s ran the same query %d times: %s", record['method'], record['route'], count, sql[:300])
+        registry.add(record)
+        if self.log_path:
+            with self.log_lock, open(self.log_path, 'a') as log:
+                log.write(json.dumps(record) + '\n')
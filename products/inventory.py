@@ -0,0 +1,166 @@
+import logging
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+from products.analytics import record_status_change
+from products.models import Order, Product, StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def reservation_expiry(now=None):
+    return (now or timezone.now()) + settings.STOCK_RESERVATION_TTL
+
+
+def _restock(quantities):
+    """Put {product_id: quantity} back in stock with a single UPDATE."""
+    return Product.objects.filter(pk__in=list(quantities)).update_with_version(
+        available_quantity=Case(
+            *[When(pk=pk, then=F('available_quantity') + quantity) for pk, quantity in quantities.items()]
+        )
+    )
+
+
+def _take_stock(quantities):
+    """Take {product_id: quantity} out of stock with one conditional UPDATE, all or nothing."""
+    condition = Q()
+    for pk, quantity in quantities.items():
+        condition |= Q(pk=pk, available_quantity__gte=quantity)
+    updated = Product.objects.filter(condition).update_with_version(
+        available_quantity=Case(*[When(pk=pk, then=F('available_quantity') - quantity)
+                                  for pk, quantity in quantities.items()])
+    )
+    if updated != len(quantities):
+        raise OutOfStock("Some items sold out while you were checking out, please review your cart")
+
+
+def reserve_stock(order, lines):
+    """
+    Take stock for an order and record time-boxed reservations; `lines` are (product, quantity) pairs.
+    The decrement is conditional (`WHERE available_quantity >= n`) so concurrent checkouts can never
+    drive stock negative: if any line no longer fits, nothing is taken and OutOfStock is raised.
+    Must run inside the checkout transaction. Products without a tracked quantity are not reserved.
+    """
+    tracked = Counter()
+    for product, quantity in lines:
+        if product.available_quantity is not None:
+            tracked[product.pk] += quantity
+    if not tracked:
+        return []
+
+    _take_stock(tracked)
+    expires_at = reservation_expiry()
+    return StockReservation.objects.bulk_create([
+        StockReservation(order=order, product_id=pk, quantity=quantity, expires_at=expires_at)
+        for pk, quantity in tracked.items()
+    ])
+
+
+def commit_reservations(order_ids):
+    """
+    Payment went through: the held stock is sold. An order paid after its stock went back on the
+    shelf (payment failed earlier, or the sweeper expired it) takes the stock again if it is still
+    there, and a swept order is reopened. Orders whose stock is gone, or that the buyer cancelled,
+    are flagged payment_status 'refund_due' instead. Returns the number of reservations committed.
+    """
+    with transaction.atomic():
+        committed = StockReservation.objects.filter(order_id__in=order_ids, status=StockReservation.HELD).update(
+            status=StockReservation.COMMITTED
+        )
+        late = defaultdict(list)
+        for row in (StockReservation.objects.select_for_update()
+                    .filter(order_id__in=order_ids, status__in=[StockReservation.RELEASED, StockReservation.EXPIRED])
+                    .values_list('id', 'order_id', 'product_id', 'quantity', 'status')):
+            late[row[1]].append(row)
+        if not late:
+            return committed
+
+        statuses = dict(Order.objects.select_for_update().filter(pk__in=list(late)).values_list('pk', 'status'))
+        refund, reopened = [], []
+        for order_id, rows in late.items():
+            swept = all(row[4] == StockReservation.EXPIRED for row in rows)
+            if statuses[order_id] == Order.CANCELLED and not swept:
+                refund.append(order_id)  # cancelled by the buyer
+                continue
+            quantities = Counter()
+            for _, _, product_id, quantity, _ in rows:
+                quantities[product_id] += quantity
+            try:
+                with transaction.atomic():  # savepoint: this order's stock is taken whole or not at all
+                    _take_stock(quantities)
+            except OutOfStock:
+                refund.append(order_id)
+                continue
+            StockReservation.objects.filter(id__in=[row[0] for row in rows]).update(
+                status=StockReservation.COMMITTED, released_at=None
+            )
+            committed += len(rows)
+            if statuses[order_id] == Order.CANCELLED:
+                reopened.append(order_id)
+
+        Order.objects.filter(pk__in=reopened).update(status=Order.CHECKOUT)
+        record_status_change(reopened, Order.CANCELLED, Order.CHECKOUT)
+        if refund:
+            logger.warning("Orders %s were paid after their stock went back on sale, refund due", refund)
+            Order.objects.filter(pk__in=refund).update(payment_status='refund_due')
+    return committed
+
+
+def release_reservations(order_ids, statuses=(StockReservation.HELD,), new_status=StockReservation.RELEASED):
+    """Return reserved stock to the shelf; each reservation is released at most once."""
+    with transaction.atomic():
+        rows = list(
+            StockReservation.objects.select_for_update()
+            .filter(order_id__in=order_ids, status__in=statuses)
+            .values_list('id', 'product_id', 'quantity')
+        )
+        if not rows:
+            return 0
+        quantities = Counter()
+        for _, product_id, quantity in rows:
+            quantities[product_id] += quantity
+        _restock(quantities)
+        StockReservation.objects.filter(id__in=[row[0] for row in rows]).update(
+            status=new_status, released_at=timezone.now()
+        )
+    return len(rows)
+
+
+def cancel_unpaid_orders(order_ids, reservation_status=StockReservation.RELEASED):
+    """
+    Put the held stock of `order_ids` back and cancel those still in checkout and unpaid
+    (e.g. the Stripe session could not be created). Returns the number of reservations released.
+    """
+    with transaction.atomic():
+        released = release_reservations(order_ids, new_status=reservation_status)
+        unpaid = list(
+            Order.objects.select_for_update().filter(pk__in=order_ids, status=Order.CHECKOUT)
+            .exclude(payment_status='completed').values_list('pk', flat=True)
+        )
+        Order.objects.filter(pk__in=unpaid).update(status=Order.CANCELLED)
+        record_status_change(unpaid, Order.CHECKOUT, Order.CANCELLED)
+    return released
+
+
+def expire_reservations(batch_size=500, now=None):
+    """
+    Sweep held reservations past their expiry back into stock and cancel their unpaid orders.
+    Returns the number of reservations expired.
+    """
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        order_ids = list(
+            StockReservation.objects.filter(status=StockReservation.HELD, expires_at__lte=now)
+            .order_by('order_id').values_list('order_id', flat=True).distinct()[:batch_size]
+        )
+        if not order_ids:
+            return expired
+        expired += cancel_unpaid_orders(order_ids, reservation_status=StockReservation.EXPIRED)
@@ -0,0 +1,148 @@
+import itertools
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from products.benchmark import (FakeStripeServer, get_seller, isolated_database, seed_activity, seed_catalogue,
+                                seed_users, summarize, write_results)
+from products.carts import get_cart_store
+from products.models import Category, Product, Subcategory
+
+ENDPOINTS = ['product-list', 'product-search', 'product-detail', 'add-product', 'cart-add', 'cart-list',
+             'checkout', 'order-history', 'wishlist']
+
+
+def jwt_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    return client
+
+
+class Command(BaseCommand):
+    help = "Load-test the products API routes against a seeded throwaway database (Stripe is stubbed locally)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--ratings', type=int, default=5, help="ratings per user")
+        parser.add_argument('--cart-items', type=int, default=3, help="cart lines per user")
+        parser.add_argument('--wishlist', type=int, default=5, help="wishlist entries per user")
+        parser.add_argument('--orders', type=int, default=3, help="past orders per user")
+        parser.add_argument('--requests', type=int, default=200, help="timed requests per endpoint")
+        parser.add_argument('--warmup', type=int, default=10, help="untimed requests per endpoint")
+        parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=ENDPOINTS)
+        parser.add_argument('--output', help="write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        with isolated_database(), FakeStripeServer() as stripe_server, \
+                override_settings(STRIPE_API_BASE=stripe_server.url, STRIPE_SECRET_KEY='sk_test_benchmark'):
+            started = time.perf_counter()
+            seller = seed_catalogue(options['products'])
+            buyers = seed_users(options['users'])
+            seed_activity(buyers, ratings=options['ratings'], cart_items=options['cart_items'],
+                          wishlist=options['wishlist'], orders=options['orders'])
+            self.stdout.write(f"Seeded {options['products']} products and {len(buyers)} users "
+                              f"in {time.perf_counter() - started:.1f}s")
+
+            self.seller_client = jwt_client(seller)
+            self.buyers = [(buyer, jwt_client(buyer)) for buyer in buyers]
+            self.product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+            self.category = Category.objects.first()
+            self.subcategory = Subcategory.objects.filter(category=self.category).first()
+            # checkout draws from a well stocked pool so repeated runs never fail on stock
+            self.checkout_pool = self.product_ids[:50]
+            Product.objects.filter(id__in=self.checkout_pool).update(available_quantity=10 ** 9)
+            self.checkout_products = Product.objects.in_bulk(self.checkout_pool)
+
+            results = []
+            for endpoint in options['endpoints']:
+                result = self.run_endpoint(endpoint, options['requests'], options['warmup'])
+                results.append(result)
+                self.stdout.write(
+                    f"{endpoint:<15} {result['throughput_rps']:>8.1f} req/s  p50={result['p50_ms']}ms "
+                    f"p95={result['p95_ms']}ms p99={result['p99_ms']}ms  queries={result['mean_queries']} "
+                    f"(max {result['max_queries']})  errors={result['errors']}"
+                )
+
+        if options['output']:
+            write_results(options['output'], {'options': {key: options[key] for key in (
+                'users', 'products', 'ratings', 'cart_items', 'wishlist', 'orders', 'requests')}, 'results': results})
+
+    def run_endpoint(self, endpoint, requests, warmup):
+        prepare = getattr(self, 'prepare_' + endpoint.replace('-', '_'))
+        samples, queries, errors = [], [], 0
+
+        for iteration in range(warmup + requests):
+            client, method, url, data = prepare(iteration)
+            extra = {'format': 'json'} if method == 'post' else {}
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = getattr(client, method)(url, data, **extra)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - start
+            if iteration < warmup:
+                continue
+            samples.append(elapsed)
+            queries.append(len(ctx.captured_queries))
+            if response.status_code >= 400:
+                if not errors:
+                    self.stderr.write(f"{endpoint}: {response.status_code} {response.content[:200]!r}")
+                errors += 1
+
+        return {
+            'endpoint': endpoint,
+            'throughput_rps': round(len(samples) / sum(samples), 1),
+            **summarize(samples),
+            'mean_queries': round(sum(queries) / len(queries), 2),
+            'max_queries': max(queries),
+            'errors': errors,
+        }
+
+    def buyer(self, iteration):
+        return self.buyers[iteration % len(self.buyers)]
+
+    def prepare_product_list(self, iteration):
+        return self.buyer(iteration)[1], 'get', reverse('products:list-create-product'), None
+
+    def prepare_product_search(self, iteration):
+        query = ['phone', 'wireless head', 'smrt watch', 'kitchen'][iteration % 4]
+        return self.buyer(iteration)[1], 'get', reverse('products:list-create-product'), {'search': query}
+
+    def prepare_product_detail(self, iteration):
+        pk = self.product_ids[iteration * 7919 % len(self.product_ids)]
+        return self.buyer(iteration)[1], 'get', reverse('products:product-detail', args=[pk]), None
+
+    def prepare_add_product(self, iteration):
+        data = {'category': self.category.id, 'subcategory': self.subcategory.id,
+                'name': f'benchmark product {iteration}', 'description': 'load test',
+                'price': 1000 + iteration, 'available_quantity': 10}
+        return self.seller_client, 'post', reverse('products:list-create-product'), data
+
+    def prepare_cart_add(self, iteration):
+        user, client = self.buyer(iteration)
+        pk = self.product_ids[(iteration * 31 + user.id) % len(self.product_ids)]
+        return client, 'post', reverse('products:cart'), {'product_id': pk, 'quantity': 1}
+
+    def prepare_cart_list(self, iteration):
+        return self.buyer(iteration)[1], 'get', reverse('products:cart'), None
+
+    def prepare_checkout(self, iteration):
+        user, client = self.buyer(iteration)
+        store = get_cart_store()
+        store.clear(user)
+        lines = itertools.islice(itertools.cycle(self.checkout_pool), iteration % len(self.checkout_pool), None)
+        for pk in itertools.islice(lines, 3):
+            store.add(user, self.checkout_products[pk], 1)
+        return client, 'post', reverse('products:checkout'), None
+
+    def prepare_order_history(self, iteration):
+        return self.buyer(iteration)[1], 'get', reverse('products:order-history'), None
+
+    def prepare_wishlist(self, iteration):
+        return self.buyer(iteration)[1], 'get', reverse('products:wishlist-list'), None
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from products import renderers
+from products.benchmark import isolated_database, measure, seed_lists, seed_users, summarize, write_results
+from products.compression import available_encodings, compress
+from products.fast_serializers import FastCartItemSerializer, FastOrderSerializer, FastProductSerializer
+from products.models import CartItem, Order, Product
+
+
+class Command(BaseCommand):
+    help = "Encode time and bytes on the wire for cart, order history and product list bodies, per renderer and coding"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[20, 100, 1000], help="rows per response")
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--output', help="write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        request = APIRequestFactory().get('/')
+        encoders = {'stdlib': JSONRenderer()}
+        if renderers.orjson is not None:
+            encoders['orjson'] = renderers.FastJSONRenderer()
+        else:
+            self.stderr.write("orjson is not installed: FastJSONRenderer falls back to the stdlib encoder")
+        results = []
+
+        with isolated_database():
+            buyer = seed_users(1, prefix='bench-response')[0]
+            for size in sorted(options['sizes']):
+                seed_lists(buyer, size)
+                # the bodies the list endpoints render, without pagination envelopes
+                bodies = {
+                    'cart': FastCartItemSerializer(FastCartItemSerializer.values(
+                        CartItem.objects.filter(user=buyer).order_by('id')[:size]), request=request).data,
+                    'order-history': FastOrderSerializer(FastOrderSerializer.values(
+                        Order.objects.filter(user=buyer).order_by('-created_at')[:size]), request=request).data,
+                    'product-list': FastProductSerializer(FastProductSerializer.values(
+                        Product.objects.order_by('-id')[:size]), request=request).data,
+                }
+                for name, data in bodies.items():
+                    rendered = {label: renderer.render(data) for label, renderer in encoders.items()}
+                    if len(set(rendered.values())) > 1:
+                        self.stderr.write(f"{name}: renderers disagree on the output")
+                    for label, renderer in encoders.items():
+                        row = {'rows': size, 'response': name, 'encoder': label, 'bytes': len(rendered[label]),
+                               'encode_p50_ms': summarize(measure(lambda: renderer.render(data),
+                                                                  options['repeat']))['p50_ms']}
+                        for encoding in available_encodings():
+                            body = rendered[label]
+                            row[f'{encoding}_bytes'] = len(compress(body, encoding))
+                            row[f'{encoding}_p50_ms'] = summarize(
+                                measure(lambda: compress(body, encoding), options['repeat']))['p50_ms']
+                        results.append(row)
+                        self.stdout.write(
+                            f"{size:>6} {name:<14} {label:<7} encode={row['encode_p50_ms']}ms "
+                            f"identity={row['bytes']}B " + ' '.join(
+                                f"{encoding}={row[f'{encoding}_bytes']}B/{row[f'{encoding}_p50_ms']}ms"
+                                for encoding in available_encodings())
+                        )
+
+        if options['output']:
+            write_results(options['output'], results)
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from rest_framework import filters
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from products.benchmark import isolated_database, measure, seed_catalogue, summarize, write_results
+from products.models import Product
+from products.search import ProductSearchFilter, rebuild_index
+
+
+class LegacySearchView:
+    search_fields = ['name', 'category__name', 'subcategory__name']
+
+
+class Command(BaseCommand):
+    help = "Compare first-page search latency of the term index against DRF SearchFilter (icontains)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--queries', nargs='+',
+                            default=['phone', 'wireless head', 'smrt watch', 'vintage lamp 4242', 'kitchen'])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--output', help="write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        factory = APIRequestFactory()
+        backends = {
+            'search_filter': (filters.SearchFilter(), LegacySearchView(), ('-id',)),
+            'search_index': (ProductSearchFilter(), None, ('-search_rank', '-id')),
+        }
+        results = []
+
+        with isolated_database():
+            for size in sorted(options['sizes']):
+                seed_catalogue(size)
+                index_time = measure(rebuild_index, 1)[0]
+                self.stdout.write(f"{size} products, index rebuilt in {index_time:.2f}s")
+
+                for query in options['queries']:
+                    request = Request(factory.get('/', {'search': query}))
+                    for backend_name, (backend, view, ordering) in backends.items():
+                        def first_page():
+                            queryset = backend.filter_queryset(request, Product.objects.all(), view)
+                            return list(queryset.order_by(*ordering)[:page_size])
+
+                        stats = summarize(measure(first_page, options['repeat']))
+                        results.append({'products': size, 'query': query, 'backend': backend_name,
+                                        'index_seconds': round(index_time, 3), **stats})
+                        self.stdout.write(
+                            f"  {backend_name:<14} {query!r:<18} p50={stats['p50_ms']}ms "
+                            f"p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms"
+                        )
+
+        if options['output']:
+            write_results(options['output'], results)
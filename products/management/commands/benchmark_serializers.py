@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+from products.benchmark import isolated_database, measure, seed_lists, seed_users, summarize, write_results
+from products.fast_serializers import FastCartItemSerializer, FastOrderSerializer, FastProductSerializer
+from products.models import CartItem, Order, Product
+from products.serializers import CartItemSerializer, OrderSerializer, ProductSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare rows/sec of the DRF list serializers against products.fast_serializers (query + render)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help="write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        request = APIRequestFactory().get('/')
+        results = []
+
+        with isolated_database():
+            buyer = seed_users(1, prefix='bench-serializer')[0]
+            for size in sorted(options['sizes']):
+                seed_lists(buyer, size)
+                products = Product.objects.order_by('id')[:size]
+                cart = CartItem.objects.filter(user=buyer).order_by('id')[:size]
+                orders = Order.objects.filter(user=buyer).order_by('-created_at')[:size]
+                cases = {
+                    'product': (
+                        lambda: ProductSerializer(list(products), many=True, context={'request': request}).data,
+                        lambda: FastProductSerializer(FastProductSerializer.values(products), request=request).data,
+                    ),
+                    'cart': (
+                        lambda: CartItemSerializer(list(cart.for_cart_display()), many=True,
+                                                   context={'request': request}).data,
+                        lambda: FastCartItemSerializer(FastCartItemSerializer.values(cart), request=request).data,
+                    ),
+                    'order': (
+                        lambda: OrderSerializer(list(orders.with_items()), many=True,
+                                                context={'request': request}).data,
+                        lambda: FastOrderSerializer(FastOrderSerializer.values(orders), request=request).data,
+                    ),
+                }
+                for name, (drf, fast) in cases.items():
+                    row = {'rows': size, 'serializer': name}
+                    for label, render in (('drf', drf), ('fast', fast)):
+                        stats = summarize(measure(render, options['repeat']))
+                        row[f'{label}_rows_per_sec'] = round(size / (stats['p50_ms'] / 1000))
+                        row[f'{label}_p50_ms'] = stats['p50_ms']
+                    row['speedup'] = round(row['fast_rows_per_sec'] / row['drf_rows_per_sec'], 2)
+                    results.append(row)
+                    self.stdout.write(
+                        f"{size:>7} {name:<8} drf={row['drf_rows_per_sec']}/s fast={row['fast_rows_per_sec']}/s "
+                        f"({row['speedup']}x)"
+                    )
+
+        if options['output']:
+            write_results(options['output'], results)
@@ -0,0 +1,31 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from products.images import build_derivatives, get_formats, get_variants
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Backfill thumbnail/WebP derivatives for existing product images"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+
+    def handle(self, *args, **options):
+        storage = Product._meta.get_field('image').storage
+        names = (Product.objects.exclude(image='').exclude(image__isnull=True)
+                 .order_by().values_list('image', flat=True).distinct())
+        paths = [storage.path(name) for name in names.iterator() if storage.exists(name)]
+        variants, formats = get_variants(), get_formats()
+
+        written = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {executor.submit(build_derivatives, path, variants, formats): path for path in paths}
+            for future in as_completed(futures):
+                try:
+                    written += len(future.result())
+                except Exception as exc:
+                    self.stderr.write(f"{futures[future]}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} derivatives for {len(paths)} images"))
@@ -0,0 +1,71 @@
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from products.images import derivative_names
+from products.models import OrderItem, Product, StoredImage
+
+
+class Command(BaseCommand):
+    help = "Delete stored product images (and their derivatives) that no product references any more"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=60,
+                            help="only collect images unreferenced for at least this many minutes")
+        parser.add_argument('--scan', action='store_true',
+                            help="also delete untracked files found under product_images/")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        storage = Product._meta.get_field('image').storage
+        cutoff = timezone.now() - timedelta(minutes=options['min_age'])
+
+        # counts are maintained incrementally; recount first so bulk writes that skipped signals can't lose files.
+        # order lines keep the image their product had at checkout, so those count as references too
+        references = Product.objects.filter(image=OuterRef('name')).order_by().values('image')
+        snapshots = OrderItem.objects.filter(product_image=OuterRef('name')).order_by().values('product_image')
+        StoredImage.objects.update(
+            ref_count=Coalesce(Subquery(references.annotate(count=Count('id')).values('count')), 0)
+            + Coalesce(Subquery(snapshots.annotate(count=Count('id')).values('count')), 0)
+        )
+
+        orphans = list(StoredImage.objects.filter(ref_count=0, updated_at__lt=cutoff).values_list('name', flat=True))
+        if options['scan']:
+            orphans += self.untracked_files(storage, cutoff)
+
+        deleted = 0
+        for name in orphans:
+            for path in [name] + [n for formats in derivative_names(name).values() for n in formats.values()]:
+                if storage.exists(path):
+                    deleted += 1
+                    if not options['dry_run']:
+                        storage.delete(path)
+        if not options['dry_run']:
+            StoredImage.objects.filter(name__in=orphans, ref_count=0).delete()
+
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {deleted} files for {len(orphans)} orphaned images"))
+
+    def untracked_files(self, storage, cutoff):
+        referenced = set(Product.objects.exclude(image='').exclude(image__isnull=True)
+                         .values_list('image', flat=True))
+        referenced |= set(OrderItem.objects.exclude(product_image='').values_list('product_image', flat=True)
+                          .distinct())
+        referenced |= set(StoredImage.objects.values_list('name', flat=True))
+        derivatives = {n for name in referenced for formats in derivative_names(name).values()
+                       for n in formats.values()}
+
+        untracked = []
+        root = storage.path('product_images')
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+                if name in referenced or name in derivatives or filename.startswith('.upload-'):
+                    continue
+                if datetime.fromtimestamp(os.path.getmtime(path), tz=dt_timezone.utc) < cutoff:
+                    untracked.append(name)
+        return untracked
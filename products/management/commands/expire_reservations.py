@@ -0,0 +1,27 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from products.inventory import expire_reservations
+
+
+class Command(BaseCommand):
+    help = "Return stock held by unpaid checkouts whose reservation has expired"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--grace', type=int, default=300,
+                            help="seconds past expiry to wait for in-flight payment webhooks")
+        parser.add_argument('--loop', action='store_true', help="keep sweeping")
+        parser.add_argument('--interval', type=float, default=60.0, help="seconds between sweeps with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            cutoff = timezone.now() - timedelta(seconds=options['grace'])
+            expired = expire_reservations(options['batch_size'], now=cutoff)
+            if expired:
+                self.stdout.write(f"Expired {expired} stock reservations")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from products.carts import get_cart_store
+
+
+class Command(BaseCommand):
+    help = "Write changed key-value carts behind to the CartItem table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help="keep flushing")
+        parser.add_argument('--interval', type=float, default=5.0, help="seconds between flushes with --loop")
+
+    def handle(self, *args, **options):
+        store = get_cart_store()
+        if not hasattr(store, 'flush_dirty'):
+            self.stdout.write("CART_STORE is 'db'; carts are already written directly")
+            return
+        while True:
+            flushed = store.flush_dirty(options['batch_size'])
+            if flushed:
+                self.stdout.write(f"Flushed {flushed} carts")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,33 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from products.catalog_io import FORMATS, CatalogueImport, guess_format, read_rows
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Bulk import products for a seller from a CSV or JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--seller', required=True, help="email of the owning seller")
+        parser.add_argument('--format', choices=FORMATS, help="defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--update', action='store_true', help="update the seller's products whose names match")
+
+    def handle(self, *args, **options):
+        try:
+            seller = User.objects.get(email=options['seller'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with email {options['seller']}")
+
+        importer = CatalogueImport(seller, batch_size=options['batch_size'], update=options['update'])
+        with open(options['path'], 'rb') as stream:
+            result = importer.run(read_rows(stream, options['format'] or guess_format(options['path'])))
+
+        for error in result['errors']:
+            self.stderr.write(f"line {error['line']}: {json.dumps(error['errors'])}")
+        self.stdout.write(f"Created {result['created']}, updated {result['updated']}, "
+                          f"{result['error_count']} rows rejected")
@@ -0,0 +1,34 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from products.webhooks import process_pending_events
+
+
+def drain(batch_size):
+    try:
+        return process_pending_events(batch_size)
+    finally:
+        connection.close()  # each worker thread has its own connection
+
+
+class Command(BaseCommand):
+    help = "Apply queued Stripe webhook events to orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--loop', action='store_true', help="keep polling for new events")
+        parser.add_argument('--interval', type=float, default=1.0, help="seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                futures = [executor.submit(drain, options['batch_size']) for _ in range(options['workers'])]
+                handled = sum(future.result() for future in futures)
+                if handled:
+                    self.stdout.write(f"Processed {handled} Stripe events")
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Recompute Product.rating_count and Product.rating_sum from the rating table"
+
+    def handle(self, *args, **options):
+        updated = Product.objects.rebuild_rating_aggregates()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {updated} products"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from products.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily product and seller sales rollups from order items"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="only rebuild days from this date (YYYY-MM-DD) on")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError("--since must be a YYYY-MM-DD date")
+        products, sellers = rebuild_rollups(since)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {products} product and {sellers} seller daily rollups"))
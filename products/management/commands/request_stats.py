@@ -0,0 +1,43 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from products.instrumentation import RouteRegistry
+
+
+class Command(BaseCommand):
+    help = "Aggregate the request instrumentation log into per-route query/latency stats"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=None, help="JSONL log (defaults to REQUEST_INSTRUMENTATION_LOG)")
+        parser.add_argument('--sort', default='mean_ms',
+                            choices=['mean_ms', 'mean_queries', 'mean_db_ms', 'count', 'duplicate_query_requests'])
+        parser.add_argument('--json', action='store_true', help="print the aggregates as JSON")
+
+    def handle(self, *args, **options):
+        path = options['log'] or settings.REQUEST_INSTRUMENTATION_LOG
+        if not path:
+            raise CommandError("No log file: pass --log or set REQUEST_INSTRUMENTATION_LOG")
+
+        registry = RouteRegistry()
+        try:
+            with open(path) as log:
+                for line in log:
+                    if line.strip():
+                        registry.add(json.loads(line))
+        except FileNotFoundError:
+            raise CommandError(f"{path} does not exist")
+
+        routes = registry.snapshot()
+        if options['json']:
+            self.stdout.write(json.dumps(routes, indent=2))
+            return
+
+        self.stdout.write(f"{'route':<55} {'count':>6} {'mean ms':>9} {'p95 ms':>7} {'db ms':>8} "
+                          f"{'ser ms':>8} {'queries':>8} {'max q':>6} {'n+1':>5}")
+        for key, stats in sorted(routes.items(), key=lambda item: item[1][options['sort']], reverse=True):
+            self.stdout.write(
+                f"{key:<55} {stats['count']:>6} {stats['mean_ms']:>9.2f} {str(stats['p95_ms'] or '>5000'):>7} "
+                f"{stats['mean_db_ms']:>8.2f} {stats['mean_serializer_ms']:>8.2f} {stats['mean_queries']:>8.2f} "
+                f"{stats['max_queries']:>6} {stats['duplicate_query_requests']:>5}"
+            )
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.5 on 2026-10-17 17:25
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Rating = apps.get_model('products', 'Rating')
+    ratings = Rating.objects.filter(product=models.OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        rating_count=Coalesce(models.Subquery(ratings.annotate(count=models.Count('id')).values('count')), 0),
+        rating_sum=Coalesce(models.Subquery(ratings.annotate(total=models.Sum('rating')).values('total')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_order_payment_intent_id_order_payment_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
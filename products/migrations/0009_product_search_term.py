@@ -0,0 +1,46 @@
+# Generated by Django 5.1.5 on 2026-10-17 17:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+from products.search import FIELD_WEIGHTS, tokenize
+
+
+def index_existing_products(apps, schema_editor):
+    # same terms as products.search.build_terms, so ?search= finds the existing catalogue right away
+    Product = apps.get_model('products', 'Product')
+    ProductSearchTerm = apps.get_model('products', 'ProductSearchTerm')
+    products = Product.objects.values_list('id', 'name', 'category__name', 'subcategory__name').order_by('pk')
+    terms = []
+    for pk, *texts in products.iterator(chunk_size=1000):
+        for field, text in zip(('name', 'category', 'subcategory'), texts):
+            terms += [ProductSearchTerm(product_id=pk, term=term, field=field, weight=FIELD_WEIGHTS[field])
+                      for term in tokenize(text)]
+        if len(terms) >= 5000:
+            ProductSearchTerm.objects.bulk_create(terms)
+            terms = []
+    ProductSearchTerm.objects.bulk_create(terms)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100)),
+                ('field', models.CharField(choices=[('name', 'Name'), ('category', 'Category'), ('subcategory', 'Subcategory')], max_length=20)),
+                ('weight', models.PositiveSmallIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='products.product')),
+            ],
+            options={
+                'db_table': 'product_search_term',
+                'indexes': [models.Index(fields=['term', 'product'], name='search_term_product_idx')],
+            },
+        ),
+        migrations.RunPython(index_existing_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.5 on 2026-10-17 17:32
+
+import utils.custom_functions
+import utils.storage
+from django.db import migrations, models
+
+
+def count_existing_images(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    StoredImage = apps.get_model('products', 'StoredImage')
+    counts = (Product.objects.exclude(image='').exclude(image__isnull=True)
+              .order_by().values('image').annotate(count=models.Count('id')))
+    StoredImage.objects.bulk_create([StoredImage(name=row['image'], ref_count=row['count']) for row in counts])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_product_version_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'stored_image',
+            },
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=utils.storage.product_image_storage, upload_to=utils.custom_functions.get_product_image),
+        ),
+        migrations.RunPython(count_existing_images, migrations.RunPython.noop),
+    ]
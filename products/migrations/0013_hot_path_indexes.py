@@ -0,0 +1,43 @@
+# Generated by Django 5.1.5 on 2026-10-17 17:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def remove_duplicate_wishlist_rows(apps, schema_editor):
+    Wishlist = apps.get_model('products', 'Wishlist')
+    keep = (Wishlist.objects.order_by().values('user', 'product')
+            .annotate(first_id=models.Min('id')).values('first_id'))
+    Wishlist.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_stripe_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['payment_intent_id'], name='order_payment_intent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name'], name='product_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='product_price_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_wishlist_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='wishlist',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_wishlist_product'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.5 on 2026-10-17 17:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_stock_reservation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.PositiveBigIntegerField(default=0)),
+                ('cancelled_orders', models.PositiveIntegerField(default=0)),
+                ('cancelled_units', models.PositiveIntegerField(default=0)),
+                ('cancelled_revenue', models.PositiveBigIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='products.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='products.product')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_product_sales', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'daily_product_sales',
+                'indexes': [models.Index(fields=['seller', 'date'], name='product_sales_seller_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'product'), name='unique_daily_product_sales')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySellerSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.PositiveBigIntegerField(default=0)),
+                ('cancelled_orders', models.PositiveIntegerField(default=0)),
+                ('cancelled_units', models.PositiveIntegerField(default=0)),
+                ('cancelled_revenue', models.PositiveBigIntegerField(default=0)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'daily_seller_sales',
+                'constraints': [models.UniqueConstraint(fields=('seller', 'date'), name='unique_daily_seller_sales')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-17 18:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def snapshot_products(apps, schema_editor):
+    OrderItem = apps.get_model('products', 'OrderItem')
+    Product = apps.get_model('products', 'Product')
+    product = Product.objects.filter(pk=models.OuterRef('product_id'))
+    OrderItem.objects.filter(product__isnull=False).update(
+        product_name=models.Subquery(product.values('name')[:1]),
+        product_image=Coalesce(models.Subquery(product.values('image')[:1]), models.Value('')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0015_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_image',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.RunPython(snapshot_products, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='products.product'),
+        ),
+    ]
@@ -0,0 +1,221 @@
+import hashlib
+import itertools
+
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework.response import Response
+from products.cache import get_facet_version
+from products.carts import GUEST_CART_HEADER, get_cart_store, is_guest_token, new_guest_token
+from products.facets import get_facets
+from products.renderers import StreamingJSONRenderer
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The resource has been modified since you last fetched it.'
+    default_code = 'precondition_failed'
+
+
+def field_value(instance, name):
+    """Attribute of a model instance or key of a `.values()` row (see FastListMixin)."""
+    if isinstance(instance, dict):
+        return instance['id' if name == 'pk' else name]
+    return getattr(instance, name)
+
+
+class ConditionalRequestMixin:
+    """
+    ETag (and Last-Modified on single objects) built from version columns, so unchanged GETs get a
+    304 without serializing anything, and PUT/PATCH honour If-Match for optimistic concurrency.
+    """
+    version_field = 'version'
+    last_modified_field = 'updated_at'
+
+    def get_etag(self, instances, many=True):
+        versions = [f'{field_value(instance, "pk")}-{field_value(instance, self.version_field)}'
+                    for instance in instances]
+        if not many:
+            return quote_etag(versions[0])
+        # lists also depend on the query (filters, cursor) and on whether there is a next/previous page
+        key = [self.request.get_full_path(),
+               str(getattr(self.paginator, 'has_next', '')), str(getattr(self.paginator, 'has_previous', ''))]
+        return quote_etag(hashlib.md5(','.join(key + versions).encode()).hexdigest())
+
+    def get_last_modified(self, instances):
+        timestamps = [field_value(instance, self.last_modified_field) for instance in instances]
+        return int(max(timestamps).timestamp()) if timestamps else None
+
+    def set_validators(self, instances, many=True):
+        etag = self.get_etag(instances, many)
+        # a list's newest updated_at doesn't move when a row leaves it, so lists only get the ETag
+        last_modified = None if many else self.get_last_modified(instances)
+        self.headers['ETag'] = etag
+        if last_modified is not None:
+            self.headers['Last-Modified'] = http_date(last_modified)
+        return etag, last_modified
+
+    def check_preconditions(self, instances, many=True):
+        """Set validator headers and return a 304/412 response if the request's conditions say so."""
+        etag, last_modified = self.set_validators(instances, many)
+        return get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        instances = page if page is not None else list(queryset)
+
+        response = self.check_preconditions(instances)
+        if response is not None:
+            return response
+
+        serializer = self.get_serializer(instances, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        response = self.check_preconditions([instance], many=False)
+        if response is not None:
+            return response
+        return Response(self.get_serializer(instance).data)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # re-read the version under a row lock so two writers can't both pass If-Match
+            current = self.get_queryset().select_for_update().get(pk=serializer.instance.pk)
+            if self.check_preconditions([current], many=False) is not None:
+                raise PreconditionFailed()
+            super().perform_update(serializer)  # the version is bumped in the database (Product.save)
+        self.set_validators([serializer.instance], many=False)
+
+
+class FacetMixin:
+    """
+    `?facets=1` adds category, subcategory and price-bucket counts for the whole filtered result
+    set to a list page (products.facets); they are cached per filter combination.
+    """
+    facets_param = 'facets'
+    facet_queryset = None
+
+    def wants_facets(self):
+        return self.request.query_params.get(self.facets_param) in ('1', 'true')
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.wants_facets():
+            self.facet_queryset = queryset
+        return queryset
+
+    def get_etag(self, instances, many=True):
+        etag = super().get_etag(instances, many)
+        if many and self.wants_facets():  # counts change with products on other pages too
+            return quote_etag(hashlib.md5(f'{etag}:{get_facet_version()}'.encode()).hexdigest())
+        return etag
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.facet_queryset is not None:
+            response.data['facets'] = get_facets(self.facet_queryset, self.request.query_params)
+        return response
+
+
+class FastListMixin:
+    """
+    GET lists are read as `.values()` rows and rendered by `fast_serializer_class`
+    (products.fast_serializers) instead of instantiating models for the DRF serializer.
+    `fast_extra_columns` are read too, e.g. the validators ConditionalRequestMixin needs;
+    annotations (such as a search rank used as the cursor) always are.
+    """
+    fast_serializer_class = None
+    fast_extra_columns = ()
+
+    def use_fast_serializer(self):
+        return self.fast_serializer_class is not None and self.request.method == 'GET'
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.use_fast_serializer():
+            queryset = self.fast_serializer_class.values(
+                queryset, *self.fast_extra_columns, *queryset.query.annotations)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if kwargs.get('many') and self.use_fast_serializer():
+            return self.fast_serializer_class(*args, request=self.request)
+        return super().get_serializer(*args, **kwargs)
+
+
+class StreamingListMixin:
+    """
+    Lists that come back whole (views without a paginator, or `?stream=1` from staff) are streamed:
+    the queryset is read with .iterator(chunk_size), and each chunk is serialized and written before
+    the next is fetched, so memory stays flat whatever the row count. Headers are sent before the
+    first row is read, so an error mid-stream truncates the body instead of returning a 500.
+    """
+    stream_param = 'stream'
+    stream_chunk_size = getattr(settings, 'API_STREAM_CHUNK_SIZE', 1000)
+
+    def should_stream(self):
+        if self.paginator is None:
+            return True
+        return self.request.user.is_staff and self.request.query_params.get(self.stream_param) in ('1', 'true')
+
+    def list(self, request, *args, **kwargs):
+        if not self.should_stream():
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.paginator is not None:  # same order as the pages would have had (e.g. best search match first)
+            queryset = queryset.order_by(*self.paginator.get_ordering(request, queryset, self))
+        elif not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        chunks = self.serialized_chunks(queryset)
+        return StreamingHttpResponse(StreamingJSONRenderer().render_stream(chunks), content_type='application/json')
+
+    def serialized_chunks(self, queryset):
+        rows = queryset.iterator(chunk_size=self.stream_chunk_size)
+        while chunk := list(itertools.islice(rows, self.stream_chunk_size)):
+            yield self.get_serializer(chunk, many=True).data
+
+
+class CartStoreMixin:
+    """
+    Resolves whose cart a request works on through the configured cart store. Anonymous requests
+    get a guest cart identified by the X-Cart-Token header (issued on first use) when the store
+    supports it; an authenticated request that still sends the header has that guest cart merged in.
+    """
+    new_cart_token = None
+    cart_owner = None
+
+    @property
+    def cart_store(self):
+        return get_cart_store()
+
+    def get_cart_owner(self):
+        if self.cart_owner is None:
+            self.cart_owner = self.resolve_cart_owner()
+        return self.cart_owner
+
+    def resolve_cart_owner(self):
+        token = self.request.headers.get(GUEST_CART_HEADER)
+        token = token if is_guest_token(token) else None
+        if self.request.user.is_authenticated:
+            if token:
+                self.cart_store.merge(token, self.request.user)
+            return self.request.user
+        if not self.cart_store.supports_guests:
+            raise NotAuthenticated()
+        if token is None:
+            token = self.new_cart_token = new_guest_token()
+        return token
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.new_cart_token:
+            response[GUEST_CART_HEADER] = self.new_cart_token
+        return response
@@ -1,6 +1,9 @@
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from utils.custom_functions import get_product_image
+from utils.storage import product_image_storage
 
 User = get_user_model()
 
@@ -32,6 +35,20 @@ class Subcategory(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    # queryset.update() skips save(), so bulk writes that change the API payload bump the version here
+    def update_with_version(self, **kwargs):
+        return self.update(version=models.F('version') + 1, updated_at=timezone.now(), **kwargs)
+
+    # recompute the denormalized rating columns from the rating table in a single UPDATE
+    def rebuild_rating_aggregates(self):
+        ratings = Rating.objects.filter(product=models.OuterRef('pk')).order_by().values('product')
+        return self.update_with_version(
+            rating_count=Coalesce(models.Subquery(ratings.annotate(count=models.Count('id')).values('count')), 0),
+            rating_sum=Coalesce(models.Subquery(ratings.annotate(total=models.Sum('rating')).values('total')), 0),
+        )
+
+
 # could be added custom_product_id
 class Product(models.Model):
     name = models.CharField(max_length=100)
@@ -41,20 +58,62 @@ class Product(models.Model):
     price = models.PositiveIntegerField()
     description = models.TextField(blank=True, null=True)
     available_quantity = models.IntegerField(blank=True, null=True)
-    image = models.ImageField(upload_to=get_product_image, blank=True, null=True)
+    image = models.ImageField(upload_to=get_product_image, storage=product_image_storage, blank=True, null=True)
+    # maintained incrementally by ProductRatingAPIView, rebuilt by `manage.py rebuild_rating_aggregates`
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    # ETag / If-Match validators, see products.mixins.ConditionalRequestMixin
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         db_table = 'product'
+        indexes = [
+            models.Index(fields=['name'], name='product_name_idx'),  # ProductSerializer.validate_name
+            models.Index(fields=['price'], name='product_price_idx'),  # ProductFilter min/max price
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        bump = not self._state.adding
+        if bump:
+            # incremented in the database, so a stale instance can't reuse or rewind a version
+            self.version = models.F('version') + 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+        if bump:
+            self.refresh_from_db(fields=['version'])
+
+    @property
+    def average_rating(self):
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
+
+class CartItemQuerySet(models.QuerySet):
+    # cart listing nests the full product, so join it in the same query
+    def for_cart_display(self):
+        return self.select_related('product')
+
+    # checkout reads product name/price/stock for every line and locks the cart rows; stock itself is
+    # taken with a conditional UPDATE (products.inventory), so product rows aren't locked up front
+    def for_checkout(self):
+        return self.select_related('product').select_for_update(of=('self',)).order_by('product_id')
+
 
 class CartItem(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart_items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='carts')
     quantity = models.PositiveIntegerField(default=1)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = ('user', 'product')
 
@@ -62,6 +121,12 @@ class CartItem(models.Model):
         return f"{self.product.name} x {self.quantity} in {self.user.username}'s cart"
 
 
+class OrderQuerySet(models.QuerySet):
+    # order items carry their own product snapshot, so one extra query covers the whole page
+    def with_items(self):
+        return self.prefetch_related(models.Prefetch('order_items', queryset=OrderItem.objects.order_by('id')))
+
+
 # can generate order_id
 class Order(models.Model):
     CHECKOUT = 'CH'
@@ -79,7 +144,8 @@ class Order(models.Model):
     PAYMENT_STATUS = [
         ('pending', 'Pending'),
         ('completed', 'Completed'),
-        ('failed', 'Failed')
+        ('failed', 'Failed'),
+        ('refund_due', 'Refund due'),  # paid after the order's stock went back on sale
     ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
@@ -89,8 +155,14 @@ class Order(models.Model):
     payment_intent_id = models.CharField(max_length=200, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         db_table = 'order'
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),  # order history
+            models.Index(fields=['payment_intent_id'], name='order_payment_intent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.status}"
@@ -98,15 +170,24 @@ class Order(models.Model):
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='order_items')
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_items')
+    # kept as a link only: the line renders from the snapshot below and outlives the product
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, related_name='order_items', blank=True, null=True)
     quantity = models.PositiveIntegerField()
-    price = models.PositiveIntegerField()
+    price = models.PositiveIntegerField()  # unit price at checkout
+    # snapshot of the product at checkout, never updated afterwards
+    product_name = models.CharField(max_length=100, default='')
+    product_image = models.CharField(max_length=255, blank=True, default='')
 
     class Meta:
         db_table = 'order_item'
 
     def __str__(self):
-        return f"{self.product.name} x {self.quantity} in {self.product.user.username}'s order"
+        return f"{self.product_name} x {self.quantity} in order {self.order_id}"
+
+    @classmethod
+    def from_product(cls, product, **kwargs):
+        return cls(product=product, price=product.price, product_name=product.name,
+                   product_image=product.image.name or '', **kwargs)
 
 class Address(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='address')
@@ -142,6 +223,177 @@ class Wishlist(models.Model):
 
     class Meta:
         db_table = 'wishlist'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_wishlist_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} - {self.product.ratings}"
+
+# inverted index behind product search, maintained by products.search
+class ProductSearchTerm(models.Model):
+    NAME = 'name'
+    CATEGORY = 'category'
+    SUBCATEGORY = 'subcategory'
+
+    FIELD_CHOICES = [
+        (NAME, 'Name'),
+        (CATEGORY, 'Category'),
+        (SUBCATEGORY, 'Subcategory'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_terms')
+    term = models.CharField(max_length=100)
+    field = models.CharField(max_length=20, choices=FIELD_CHOICES)
+    weight = models.PositiveSmallIntegerField()
+
+    class Meta:
+        db_table = 'product_search_term'
+        indexes = [
+            models.Index(fields=['term', 'product'], name='search_term_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.product_id}"
+
+
+class StoredImageQuerySet(models.QuerySet):
+    def add_reference(self, name):
+        if name:
+            self.get_or_create(name=name)
+            self.filter(name=name).update(ref_count=models.F('ref_count') + 1, updated_at=timezone.now())
+
+    def remove_reference(self, name):
+        if name:
+            self.filter(name=name, ref_count__gt=0).update(ref_count=models.F('ref_count') - 1,
+                                                           updated_at=timezone.now())
+
+
+# reference counts for content-addressed product images; unreferenced files are removed by
+# `manage.py collect_orphan_images`
+class StoredImage(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = StoredImageQuerySet.as_manager()
+
+    class Meta:
+        db_table = 'stored_image'
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+
+# inbox of verified Stripe webhook events, drained by `manage.py process_stripe_events`
+class StripeEvent(models.Model):
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    PROCESSED = 'processed'
+    FAILED = 'failed'
+
+    STATUS = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (PROCESSED, 'Processed'),
+        (FAILED, 'Failed'),
+    ]
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'stripe_event'
+        indexes = [
+            models.Index(fields=['status', 'received_at'], name='stripe_event_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_id} ({self.type}) - {self.status}"
+
+
+# stock held for an order between checkout and payment, see products.inventory
+class StockReservation(models.Model):
+    HELD = 'held'
+    COMMITTED = 'committed'
+    RELEASED = 'released'
+    EXPIRED = 'expired'
+
+    STATUS = [
+        (HELD, 'Held'),
+        (COMMITTED, 'Committed'),
+        (RELEASED, 'Released'),
+        (EXPIRED, 'Expired'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS, default=HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    released_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'stock_reservation'
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservation_status_idx'),  # sweeper
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for order {self.order_id} - {self.status}"
+
+
+# daily sales rollups maintained by products.analytics, rebuilt by `manage.py rebuild_sales_rollups`;
+# orders are counted on the day they were placed, cancellations against that same day
+class SalesRollup(models.Model):
+    date = models.DateField()
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.PositiveBigIntegerField(default=0)
+    cancelled_orders = models.PositiveIntegerField(default=0)
+    cancelled_units = models.PositiveIntegerField(default=0)
+    cancelled_revenue = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailyProductSales(SalesRollup):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    # copied from the product when the row is created, so seller/category breakdowns need no join
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_product_sales')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+
+    class Meta:
+        db_table = 'daily_product_sales'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='unique_daily_product_sales'),
+        ]
+        indexes = [
+            models.Index(fields=['seller', 'date'], name='product_sales_seller_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.date}: {self.units} units"
+
+
+class DailySellerSales(SalesRollup):
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_sales')
+
+    class Meta:
+        db_table = 'daily_seller_sales'
+        constraints = [
+            models.UniqueConstraint(fields=['seller', 'date'], name='unique_daily_seller_sales'),
+        ]
 
     def __str__(self):
-        return f"{self.product.name} - {self.product.ratings}"
\ No newline at end of file
+        return f"{self.seller_id} on {self.date}: {self.revenue}"
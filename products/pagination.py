@@ -0,0 +1,28 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+# keyset pagination: cursors are opaque and each page costs O(page_size) whatever its position
+class KeysetPagination(CursorPagination):
+    page_size = getattr(settings, 'API_PAGE_SIZE', 20)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+    ordering = '-id'
+
+
+class ProductCursorPagination(KeysetPagination):
+    ordering = '-id'
+
+    # search results are paged best match first
+    def get_ordering(self, request, queryset, view):
+        if 'search_rank' in queryset.query.annotations:
+            return ('-search_rank', '-id')
+        return super().get_ordering(request, queryset, view)
+
+
+class OrderCursorPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')  # created_at isn't unique
+
+
+class RatingCursorPagination(KeysetPagination):
+    ordering = '-id'
@@ -0,0 +1,74 @@
+import asyncio
+import functools
+import weakref
+
+import httpx
+import stripe
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from products.inventory import reservation_expiry
+
+# async clients hold an httpx.AsyncClient, which is bound to the event loop that first used it
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _build_client():
+    """
+    StripeClient with its own keep-alive connection pool, explicit timeouts and Stripe's built-in
+    retries (exponential backoff with jitter), instead of the module-global `stripe.api_key`.
+    """
+    timeout = httpx.Timeout(settings.STRIPE_TIMEOUT, connect=settings.STRIPE_CONNECT_TIMEOUT)
+    base_addresses = {'api': settings.STRIPE_API_BASE} if settings.STRIPE_API_BASE else {}
+    return stripe.StripeClient(
+        settings.STRIPE_SECRET_KEY or '',
+        http_client=stripe.HTTPXClient(timeout=timeout, allow_sync_methods=True),
+        max_network_retries=settings.STRIPE_MAX_NETWORK_RETRIES,
+        base_addresses=base_addresses,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_stripe_client():
+    return _build_client()
+
+
+def get_async_stripe_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = _build_client()
+    return client
+
+
+@receiver(setting_changed)
+def reset_stripe_clients(setting, **kwargs):
+    if setting.startswith('STRIPE_'):
+        get_stripe_client.cache_clear()
+        _async_clients.clear()
+
+
+def checkout_session_params(order, cart_items, success_url, cancel_url):
+    return {
+        "payment_method_types": ["card"],  # Only INR payment methods
+        "line_items": [
+            {
+                "price_data": {
+                    "currency": "inr",
+                    "unit_amount": int(item.product.price * 100),  # INR to Paisa
+                    "product_data": {
+                        "name": item.product.name
+                    }
+                },
+                "quantity": item.quantity,
+            }
+            for item in cart_items
+        ],
+        "mode": "payment",
+        "currency": "inr",
+        "success_url": success_url + "?session_id={CHECKOUT_SESSION_ID}",
+        "cancel_url": cancel_url,
+        "metadata": {"order_id": order.id},
+        # stop taking payment once the stock reservation lapses
+        "expires_at": int(reservation_expiry().timestamp()),
+    }
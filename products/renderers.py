@@ -0,0 +1,49 @@
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed, producing the same bytes: compact,
+    UTF-8, U+2028/U+2029 escaped, and datetimes, decimals, lazy strings etc. handed to DRF's encoder.
+    Anything orjson refuses (ints over 64 bits) and non-default output (indent, ASCII-only, NaN
+    allowed) go through JSONRenderer itself. Under strict JSON, NaN renders as null instead of raising.
+    """
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or not self.compact or self.ensure_ascii or not self.strict
+                or self.get_indent(accepted_media_type, renderer_context or {})):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            body = orjson.dumps(data, default=JSONEncoder().default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # same escaping as JSONRenderer, so the output stays a strict javascript subset
+        return body.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class StreamingJSONRenderer(FastJSONRenderer):
+    """
+    Renderer for lists too large to hold as one body: `render_stream()` takes the list as an
+    iterable of chunks (lists of items) and yields the JSON array one encoded chunk at a time.
+    Output is byte-for-byte what JSONRenderer produces for the concatenated list.
+    """
+
+    def render_stream(self, chunks):
+        separator = (SHORT_SEPARATORS if self.compact else LONG_SEPARATORS)[0].encode()
+        yield b'['
+        first = True
+        for chunk in chunks:
+            if not chunk:
+                continue
+            body = self.render(list(chunk))[1:-1]  # the items without the enclosing brackets
+            yield body if first else separator + body
+            first = False
+        yield b']'
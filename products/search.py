@@ -0,0 +1,159 @@
+import re
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Length
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+from products.models import Product, ProductSearchTerm
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_TERM_LENGTH = 100
+# upper bound on index terms a single query token may expand to (prefix / typo matches)
+MAX_EXPANSIONS = 50
+
+FIELD_WEIGHTS = {
+    ProductSearchTerm.NAME: 3,
+    ProductSearchTerm.SUBCATEGORY: 2,
+    ProductSearchTerm.CATEGORY: 1,
+}
+
+# exact hits rank above prefix hits, which rank above typo-tolerant hits
+EXACT_BOOST = 4
+PREFIX_BOOST = 2
+FUZZY_BOOST = 1
+
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_RE.findall((text or '').lower()):
+        token = token[:MAX_TERM_LENGTH]
+        if token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+def _prefix_range(prefix):
+    # a range on the term index instead of LIKE 'x%', which not every backend can serve from an index
+    return {'term__gte': prefix, 'term__lt': prefix + '\uffff'}
+
+
+def edit_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def allowed_typos(token):
+    if len(token) >= 8:
+        return 2
+    if len(token) >= 4:
+        return 1
+    return 0
+
+
+def expand_token(token):
+    """Map a query token to {index term: boost} using exact, prefix and then typo-tolerant matching."""
+    terms = ProductSearchTerm.objects.order_by().values_list('term', flat=True).distinct()
+
+    # the exact term first, then the terms on the most products, so the cap drops the rarest completions
+    prefixed = (ProductSearchTerm.objects.filter(**_prefix_range(token)).values('term')
+                .annotate(products=Count('product_id'))
+                .order_by(Case(When(term=token, then=Value(0)), default=Value(1)), '-products', 'term'))
+    expansions = {row['term']: (EXACT_BOOST if row['term'] == token else PREFIX_BOOST)
+                  for row in prefixed[:MAX_EXPANSIONS]}
+    if expansions:
+        return expansions
+
+    limit = allowed_typos(token)
+    if not limit:
+        return {}
+    candidates = terms.annotate(length=Length('term')).filter(
+        length__gte=len(token) - limit, length__lte=len(token) + limit, **_prefix_range(token[0])
+    )
+    matches = sorted(
+        (edit_distance(token, term, limit), term) for term in candidates.iterator()
+    )
+    return {term: FUZZY_BOOST for distance, term in matches[:MAX_EXPANSIONS] if distance <= limit}
+
+
+def search_products(queryset, query):
+    """Restrict `queryset` to products matching every token of `query`, annotated with `search_rank`."""
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset
+
+    boosts = {}
+    for token in tokens:
+        expansions = expand_token(token)
+        if not expansions:
+            return queryset.none()
+        matching = ProductSearchTerm.objects.filter(term__in=list(expansions)).values('product_id')
+        queryset = queryset.filter(pk__in=matching)
+        for term, boost in expansions.items():
+            boosts[term] = max(boost, boosts.get(term, 0))
+
+    # rank from a single join + GROUP BY over the matched index rows
+    boost = Case(*[When(search_terms__term=term, then=Value(value)) for term, value in boosts.items()],
+                 default=Value(0), output_field=IntegerField())
+    return queryset.filter(search_terms__term__in=list(boosts)).annotate(
+        search_rank=Sum(F('search_terms__weight') * boost, output_field=IntegerField())
+    )
+
+
+def build_terms(product):
+    fields = [
+        (ProductSearchTerm.NAME, product.name),
+        (ProductSearchTerm.CATEGORY, product.category.name),
+        (ProductSearchTerm.SUBCATEGORY, product.subcategory.name),
+    ]
+    return [
+        ProductSearchTerm(product_id=product.pk, term=term, field=field, weight=FIELD_WEIGHTS[field])
+        for field, text in fields
+        for term in tokenize(text)
+    ]
+
+
+def index_products(product_ids=None, batch_size=1000):
+    """(Re)build index entries for the given products, or for the whole catalogue."""
+    queryset = Product.objects.select_related('category', 'subcategory').only(
+        'id', 'name', 'category__name', 'subcategory__name'
+    ).order_by('pk')
+    if product_ids is not None:
+        queryset = queryset.filter(pk__in=product_ids)
+
+    indexed = 0
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return indexed
+        with transaction.atomic():
+            ProductSearchTerm.objects.filter(product_id__in=[product.pk for product in batch]).delete()
+            ProductSearchTerm.objects.bulk_create(
+                [term for product in batch for term in build_terms(product)], batch_size=batch_size
+            )
+        indexed += len(batch)
+        last_pk = batch[-1].pk
+
+
+def rebuild_index(batch_size=1000):
+    ProductSearchTerm.objects.all().delete()
+    return index_products(batch_size=batch_size)
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    """Drop-in replacement for SearchFilter on product views, served from the search term index."""
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        return search_products(queryset, query)
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from django.db.models import Avg
+from products.images import derivative_names
 from products.models import (Category, Subcategory,
                              Product, Rating, CartItem,
                              OrderItem, Order, Wishlist)
@@ -8,12 +8,6 @@ from products.models import (Category, Subcategory,
 User = get_user_model()
 
 
-class CategorySerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Category
-        fields = ['id', 'name', 'description', 'subcategory_set']
-        # depth = 1
-
 class SubCategorySerializer(serializers.ModelSerializer):
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all())
 
@@ -21,14 +15,43 @@ class SubCategorySerializer(serializers.ModelSerializer):
         model = Subcategory
         fields = ['id', 'category', 'name', 'description']
 
+class CategorySerializer(serializers.ModelSerializer):
+    subcategories = SubCategorySerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'description', 'subcategories']
+        # depth = 1
+
+def image_variant_urls(name, request=None):
+    storage = Product._meta.get_field('image').storage
+    variants = {}
+    for variant, formats in derivative_names(name).items():
+        urls = {fmt: storage.url(derivative) for fmt, derivative in formats.items()}
+        if request is not None:
+            urls = {fmt: request.build_absolute_uri(url) for fmt, url in urls.items()}
+        variants[variant] = urls
+    return variants
+
+
 class ProductSerializer(serializers.ModelSerializer):
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all())
     subcategory = serializers.PrimaryKeyRelatedField(queryset=Subcategory.objects.all())
     # image = serializers.ListField(child=serializers.ImageField(), write_only=True, required=False)
+    average_rating = serializers.FloatField(read_only=True)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        fields = ['id', 'category', 'subcategory', 'name', 'description', 'price', 'available_quantity', 'image']
+        fields = ['id', 'category', 'subcategory', 'name', 'description', 'price', 'available_quantity', 'image',
+                  'image_variants', 'average_rating', 'rating_count']
+        read_only_fields = ['rating_count']
+
+    # thumbnail/medium derivatives in each configured format (see products.images)
+    def get_image_variants(self, obj):
+        if not obj.image:
+            return None
+        return image_variant_urls(obj.image.name, self.context.get('request'))
 
     # unique product_name
     def validate_name(self, value):
@@ -64,6 +87,19 @@ class ProductSerializer(serializers.ModelSerializer):
     #
     #     return instance
 
+# one row of a bulk catalogue import (products.catalog_io); names are resolved and checked per batch there
+class ProductImportSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100)
+    description = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    price = serializers.IntegerField(min_value=0)
+    available_quantity = serializers.IntegerField(required=False, allow_null=True)
+    category = serializers.CharField(max_length=100)
+    subcategory = serializers.CharField(max_length=100)
+
+    def to_internal_value(self, data):
+        # CSV has no nulls, so blank cells count as missing
+        return super().to_internal_value({key: value for key, value in data.items() if value != ''})
+
 class ProductRatingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Rating
@@ -77,20 +113,27 @@ class CartItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = CartItem
-        fields = ['id', 'product', 'product_id', 'quantity']
+        # no row id: cart items are addressed by product (cart/<product_id>/), and kv carts have no rows
+        fields = ['product', 'product_id', 'quantity']
 
     def validate_quantity(self, attrs):
         if attrs <= 0:
             raise serializers.ValidationError("Product quantity must be positive.!!!")
         return attrs
 
+# rendered from the snapshot taken at checkout, never from the live product
 class OrderItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer()
-    order = serializers.PrimaryKeyRelatedField(queryset=Order.objects.all())
+    thumbnail = serializers.SerializerMethodField()
 
     class Meta:
         model = OrderItem
-        fields = ['order', 'product', 'quantity', 'price']
+        fields = ['order', 'product', 'product_name', 'quantity', 'price', 'thumbnail']
+        read_only_fields = fields
+
+    def get_thumbnail(self, obj):
+        if not obj.product_image:
+            return None
+        return image_variant_urls(obj.product_image, self.context.get('request')).get('thumbnail')
 
 class OrderSerializer(serializers.ModelSerializer):
     order_items = OrderItemSerializer(many=True, read_only=True)
@@ -107,8 +150,5 @@ class WishlistSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'product_review']
 
     def get_product_review(self, obj):
-        ratings = obj.product.ratings.all()
-        if ratings.exists():
-            return ratings.aggregate(average_rating=Avg('rating'))['average_rating']
-        return None
+        return obj.product.average_rating
 
@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from products.cache import invalidate_catalog, invalidate_facets
+from products.images import schedule_derivatives
+from products.models import Category, Subcategory, Product, StoredImage
+from products.search import index_products
+
+
+# search index
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created=False, raw=False, **kwargs):
+    if not (raw or created):
+        index_products(Product.objects.filter(category=instance).values('pk'))
+
+
+@receiver(post_save, sender=Subcategory)
+def reindex_subcategory_products(sender, instance, created=False, raw=False, **kwargs):
+    if not (raw or created):
+        index_products(Product.objects.filter(subcategory=instance).values('pk'))
+
+
+# category tree cache
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Subcategory)
+def invalidate_catalog_cache(sender, **kwargs):
+    invalidate_catalog()
+
+
+# facet counts
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_facet_cache(sender, **kwargs):
+    invalidate_facets()
+
+
+# image derivatives (thumbnails / webp), built after the upload is committed; only when the image changed,
+# not on every stock or rating save
+@receiver(post_save, sender=Product)
+def build_image_derivatives(sender, instance, raw=False, **kwargs):
+    if raw or not instance.image or instance.image.name == getattr(instance, '_previous_image', ''):
+        return
+    storage, name = instance.image.storage, instance.image.name
+    transaction.on_commit(lambda: schedule_derivatives(storage, name))
+
+
+# reference counts for content-addressed images
+@receiver(pre_save, sender=Product)
+def remember_previous_image(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._previous_image = ''
+    if update_fields is not None and 'image' not in update_fields:
+        instance._previous_image = instance.image.name or ''  # not written by this save
+    elif instance.pk and not raw:
+        instance._previous_image = Product.objects.filter(pk=instance.pk).values_list('image', flat=True).first() or ''
+
+
+@receiver(post_save, sender=Product)
+def count_image_reference(sender, instance, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_image', '')
+    current = instance.image.name or ''
+    if raw or previous == current:
+        return
+    StoredImage.objects.add_reference(current)
+    StoredImage.objects.remove_reference(previous)
+
+
+@receiver(post_delete, sender=Product)
+def release_image_reference(sender, instance, **kwargs):
+    StoredImage.objects.remove_reference(instance.image.name)
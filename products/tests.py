@@ -1 +1,918 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.tokens import RefreshToken
+from products.analytics import rebuild_rollups
+from products.cache import get_catalog_cache
+from products.benchmark import FakeStripeServer, get_seller, seed_users
+from products.carts import get_cart_store
+from products.checkout import CheckoutError, place_order
+from products.compression import available_encodings, choose_encoding
+from products.fast_serializers import FastCartItemSerializer, FastOrderSerializer, FastProductSerializer
+from products.images import build_derivatives
+from products.inventory import expire_reservations, reservation_expiry
+from products.instrumentation import registry as request_stats
+from products.models import (Category, Subcategory,
+                             Product, CartItem, Rating,
+                             Order, OrderItem, Wishlist,
+                             ProductSearchTerm, StripeEvent, StockReservation,
+                             DailyProductSales, DailySellerSales, StoredImage)
+from products.renderers import FastJSONRenderer, StreamingJSONRenderer
+from products.search import EXACT_BOOST, PREFIX_BOOST, expand_token
+from products.serializers import CartItemSerializer, OrderSerializer, ProductSerializer
+from products.views import WishlistAPIView
+from products.webhooks import MAX_ATTEMPTS, apply_events, claim_events, process_pending_events
+
+User = get_user_model()
+
+
+class CatalogueTestMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(email='seller@example.com', password='pass', username='seller',
+                                              role='seller')
+        cls.buyer = User.objects.create_user(email='buyer@example.com', password='pass', username='buyer',
+                                             role='buyer')
+        cls.category = Category.objects.create(name='Mobiles')
+        cls.subcategory = Subcategory.objects.create(category=cls.category, name='Smartphones')
+
+    def make_products(self, count, start=0):
+        return [
+            Product.objects.create(name=f'product-{i}', user=self.seller, category=self.category,
+                                   subcategory=self.subcategory, price=100 + i, available_quantity=10)
+            for i in range(start, start + count)
+        ]
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+
+class QueryCountTests(CatalogueTestMixin, APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(self.buyer)
+
+    def test_cart_listing_query_count_is_constant(self):
+        url = reverse('products:cart')
+        for product in self.make_products(1):
+            CartItem.objects.create(user=self.buyer, product=product, quantity=1)
+        small_cart = self.count_queries(url)
+
+        for product in self.make_products(20, start=1):
+            CartItem.objects.create(user=self.buyer, product=product, quantity=2)
+        self.assertEqual(self.count_queries(url), small_cart)
+
+    def test_order_history_query_count_is_constant(self):
+        url = reverse('products:order-history')
+        products = self.make_products(10)
+        order = Order.objects.create(user=self.buyer, total_price=100, status=Order.CHECKOUT)
+        OrderItem.objects.create(order=order, product=products[0], quantity=1, price=100)
+        single_order = self.count_queries(url)
+
+        for _ in range(5):
+            order = Order.objects.create(user=self.buyer, total_price=100, status=Order.CHECKOUT)
+            for product in products:
+                OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+        self.assertEqual(self.count_queries(url), single_order)
+
+    def test_order_history_pages_orders_placed_at_the_same_time(self):
+        orders = Order.objects.bulk_create([Order(user=self.buyer, total_price=100, status=Order.CHECKOUT)
+                                            for _ in range(5)])
+        Order.objects.update(created_at=timezone.now())
+        url, seen = reverse('products:order-history') + '?page_size=2', []
+        while url:
+            page = self.client.get(url).json()
+            seen += [order['id'] for order in page['results']]
+            url = page['next']
+        self.assertEqual(seen, sorted((order.pk for order in orders), reverse=True))
+
+
+class OrderSnapshotTests(CatalogueTestMixin, APITestCase):
+    def test_history_renders_the_checkout_snapshot(self):
+        phone, case = self.make_products(2)
+        for product in (phone, case):
+            CartItem.objects.create(user=self.buyer, product=product, quantity=1)
+        order, _ = place_order(self.buyer)
+        phone.name, phone.price = 'renamed', 999
+        phone.save()
+        case.delete()
+
+        self.client.force_authenticate(self.buyer)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('products:order-history'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in ctx.captured_queries if '"product"' in query['sql']])
+        items = response.data['results'][0]['order_items']
+        self.assertEqual([(item['product'], item['product_name'], item['price']) for item in items],
+                         [(phone.id, 'product-0', 100), (None, 'product-1', 101)])
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 2)
+
+
+class RatingAggregateTests(CatalogueTestMixin, APITestCase):
+    def rate(self, product, rating):
+        response = self.client.post(reverse('products:ratings'), {'product': product.id, 'rating': rating})
+        self.assertEqual(response.status_code, 201)
+
+    def test_posting_a_rating_updates_the_aggregate(self):
+        product = self.make_products(1)[0]
+        self.client.force_authenticate(self.buyer)
+        self.rate(product, 4)
+        rated = Product.objects.get(pk=product.pk)
+        self.assertEqual((rated.rating_count, rated.rating_sum, rated.version),
+                         (1, 4, product.version + 1))
+
+        self.client.force_authenticate(self.seller)
+        self.rate(product, 1)
+        response = self.client.get(reverse('products:product-detail', args=[product.id]))
+        self.assertEqual((response.data['rating_count'], response.data['average_rating']), (2, 2.5))
+
+    def test_incremental_aggregate_matches_a_full_recompute(self):
+        products = self.make_products(2)
+        self.client.force_authenticate(self.buyer)
+        for product, rating in ((products[0], 5), (products[0], 2), (products[1], 3)):
+            self.rate(product, rating)
+        served = [self.client.get(reverse('products:product-detail', args=[product.id])).data['average_rating']
+                  for product in products]
+        Product.objects.rebuild_rating_aggregates()
+        self.assertEqual(served, [product.average_rating for product in Product.objects.order_by('id')])
+        self.assertEqual(served, [3.5, 3.0])
+
+
+class FastSerializerTests(CatalogueTestMixin, APITestCase):
+    def setUp(self):
+        self.request = APIRequestFactory().get('/')
+        self.products = self.make_products(3)
+        self.products[0].image.name = 'product_images/ab/abc.jpg'
+        self.products[0].description = 'With image'
+        self.products[0].save()
+        Rating.objects.create(product=self.products[1], user=self.buyer, rating=4)
+        Product.objects.rebuild_rating_aggregates()
+        for product in self.products:
+            CartItem.objects.create(user=self.buyer, product=product, quantity=2)
+
+    def assert_same_json(self, drf, fast):
+        def encode(data):
+            return json.loads(json.dumps(data, cls=JSONEncoder))
+        self.assertEqual(encode(fast), encode(drf))
+        self.assertEqual([list(row) for row in fast], [list(row) for row in drf])  # key order too
+
+    def test_products(self):
+        products = Product.objects.order_by('id')
+        self.assert_same_json(
+            ProductSerializer(products, many=True, context={'request': self.request}).data,
+            FastProductSerializer(FastProductSerializer.values(products), request=self.request).data,
+        )
+
+    def test_cart_items(self):
+        cart = CartItem.objects.filter(user=self.buyer).order_by('id')
+        self.assert_same_json(
+            CartItemSerializer(cart, many=True, context={'request': self.request}).data,
+            FastCartItemSerializer(FastCartItemSerializer.values(cart), request=self.request).data,
+        )
+
+    def test_orders(self):
+        place_order(self.buyer)
+        Order.objects.create(user=self.buyer, total_price=0)
+        orders = Order.objects.order_by('id')
+        self.assert_same_json(
+            OrderSerializer(orders.with_items(), many=True, context={'request': self.request}).data,
+            FastOrderSerializer(FastOrderSerializer.values(orders), request=self.request).data,
+        )
+
+    def test_stale_instances_never_reuse_a_version(self):
+        first, second = Product.objects.get(pk=self.products[0].pk), Product.objects.get(pk=self.products[0].pk)
+        loaded = first.version
+        Product.objects.filter(pk=first.pk).update_with_version(price=1)
+        first.save()
+        second.save(update_fields=['price'])
+        self.assertEqual((first.version, second.version), (loaded + 2, loaded + 3))
+        self.assertEqual(Product.objects.get(pk=first.pk).version, loaded + 3)
+
+    def test_list_endpoints_use_the_fast_path(self):
+        self.client.force_authenticate(self.buyer)
+        response = self.client.get(reverse('products:list-create-product'))
+        self.assertEqual([row['id'] for row in response.data['results']],
+                         [product.id for product in reversed(self.products)])
+        self.assertIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)  # doesn't move when a row leaves the page
+        response = self.client.get(reverse('products:cart'))
+        self.assertEqual([row['product']['name'] for row in response.data], ['product-0', 'product-1', 'product-2'])
+
+
+class StreamingTests(CatalogueTestMixin, APITestCase):
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_stream_matches_json_renderer(self):
+        items = [{'name': 'a\u2028b', 'price': 1.5}, {'name': 'é', 'price': None}, {'name': 'c', 'price': 2}]
+        body = b''.join(StreamingJSONRenderer().render_stream([items[:2], [], items[2:]]))
+        self.assertEqual(body, JSONRenderer().render(items))
+        self.assertEqual(b''.join(StreamingJSONRenderer().render_stream([])), b'[]')
+
+    def test_unpaginated_list_is_streamed_in_chunks(self):
+        products = self.make_products(5)
+        for product in products:
+            Wishlist.objects.create(user=self.buyer, product=product)
+        self.client.force_authenticate(self.buyer)
+        with mock.patch.object(WishlistAPIView, 'stream_chunk_size', 2):
+            response = self.client.get(reverse('products:wishlist-list'))
+            with CaptureQueriesContext(connection) as ctx:
+                chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 5)  # '[', three chunks of at most two rows, ']'
+        self.assertEqual(len(ctx.captured_queries), 1)  # rows are fetched from one cursor as they are sent
+        rows = json.loads(b''.join(chunks))
+        self.assertEqual([row['product'] for row in rows], [product.id for product in products])
+
+    def test_staff_can_stream_paginated_lists(self):
+        self.make_products(3)
+        url = reverse('products:list-create-product') + '?stream=1'
+        self.client.force_authenticate(self.buyer)
+        paginated = self.client.get(url)
+        self.assertEqual(len(paginated.data['results']), 3)
+
+        self.client.force_authenticate(User.objects.create_user(email='staff@example.com', password='pass',
+                                                                username='staff', is_staff=True))
+        rows = json.loads(self.read(self.client.get(url)))
+        self.assertEqual(rows, json.loads(json.dumps(paginated.data['results'], cls=JSONEncoder)))
+
+        for name in ('phone', 'phones'):
+            Product.objects.create(name=name, user=self.seller, category=self.category,
+                                   subcategory=self.subcategory, price=100)
+        rows = json.loads(self.read(self.client.get(url + '&search=phone')))
+        self.assertEqual([row['name'] for row in rows], ['phone', 'phones'])  # best match first, not -id
+
+
+class ResponseEncodingTests(CatalogueTestMixin, APITestCase):
+    def test_fast_renderer_matches_json_renderer(self):
+        data = {'name': 'é\u2028', 'price': Decimal('9.50'), 'when': timezone.now(), 'day': timezone.localdate(),
+                1: [None, True, 1.5], 'lazy': gettext_lazy('Mobiles'), 'big': 2 ** 70}
+        expected = JSONRenderer().render(data)
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+        with mock.patch('products.renderers.orjson', None):  # falls back cleanly without orjson
+            self.assertEqual(FastJSONRenderer().render(data), expected)
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=2'),
+                         JSONRenderer().render(data, 'application/json; indent=2'))
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(choose_encoding('*'), available_encodings()[0])
+        self.assertIsNone(choose_encoding('gzip;q=0, identity'))
+        self.assertIsNone(choose_encoding(''))
+
+    def test_large_responses_are_compressed(self):
+        self.make_products(20)
+        url = reverse('products:list-create-product')
+        self.client.force_authenticate(self.buyer)
+        plain = self.client.get(url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+
+    @override_settings(COMPRESSION_MIN_SIZE=0)
+    def test_weakened_etag_still_matches_if_match(self):
+        product = self.make_products(1)[0]
+        url = reverse('products:product-detail', args=[product.pk])
+        self.client.force_authenticate(self.seller)
+        etag = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        response = self.client.patch(url, {'price': 150}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch(url, {'price': 160}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+
+    @override_settings(COMPRESSION_MIN_SIZE=0)
+    def test_exempt_routes_and_streams(self):
+        product = self.make_products(1)[0]
+        self.client.force_authenticate(self.buyer)
+        self.client.post(reverse('products:cart'), {'product_id': product.pk, 'quantity': 1}, format='json')
+        response = self.client.get(reverse('products:cart-item', args=[product.pk]), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        Wishlist.objects.create(user=self.buyer, product=product)
+        response = self.client.get(reverse('products:wishlist-list'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        rows = json.loads(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual([row['product'] for row in rows], [product.pk])
+
+
+class QueryPlanTests(CatalogueTestMixin, APITestCase):
+    """EXPLAIN the hot lookups so a dropped or unusable index shows up as a full table scan."""
+
+    def assert_uses_index(self, queryset):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # tiny test tables would otherwise be seq-scanned even with a usable index
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+        table = queryset.model._meta.db_table
+        if connection.vendor == 'postgresql':
+            self.assertNotIn(f'Seq Scan on {table}', plan, plan)
+        else:
+            scans = [line for line in plan.splitlines()
+                     if f'SCAN {table}' in line and 'USING' not in line]
+            self.assertFalse(scans, plan)
+
+    def test_hot_lookups_use_indexes(self):
+        product = self.make_products(1)[0]
+        querysets = [
+            Order.objects.filter(user=self.buyer).order_by('-created_at'),
+            Order.objects.filter(payment_intent_id='cs_test_1'),
+            Wishlist.objects.filter(user=self.buyer, product=product),
+            Rating.objects.filter(product=product),  # FK index
+            CartItem.objects.filter(user=self.buyer),
+            Product.objects.filter(name='product-0'),
+            Product.objects.filter(price__gte=100, price__lte=200),
+            ProductSearchTerm.objects.filter(term='product'),
+            StripeEvent.objects.filter(status=StripeEvent.PENDING).order_by('received_at'),
+        ]
+        for queryset in querysets:
+            with self.subTest(query=str(queryset.query)):
+                self.assert_uses_index(queryset)
+
+    def test_wishlist_rejects_duplicates(self):
+        product = self.make_products(1)[0]
+        self.client.force_authenticate(self.buyer)
+        url = reverse('products:wishlist-list')
+        self.assertEqual(self.client.post(url, {'product': product.id}).status_code, 201)
+        self.assertEqual(self.client.post(url, {'product': product.id}).status_code, 400)
+        self.assertEqual(Wishlist.objects.filter(user=self.buyer).count(), 1)
+
+
+@override_settings(REQUEST_INSTRUMENTATION=True)
+class InstrumentationTests(CatalogueTestMixin, APITestCase):
+    def setUp(self):
+        request_stats.reset()
+
+    def test_server_timing_and_route_stats(self):
+        for product in self.make_products(5):
+            Wishlist.objects.create(user=self.buyer, product=product)
+        self.client.force_authenticate(self.buyer)
+        response = self.client.get(reverse('products:wishlist-list'))
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries", serializer;dur=')
+        b''.join(response.streaming_content)  # the wishlist is streamed, recorded once it is read
+
+        stats = request_stats.snapshot()['GET api/products/wishlist/$']
+        self.assertEqual(stats['count'], 1)
+        self.assertGreater(stats['mean_queries'], 0)
+
+        self.client.force_authenticate(User.objects.create_user(email='staff@example.com', password='pass',
+                                                                username='staff', is_staff=True))
+        response = self.client.get(reverse('products:request-stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('GET api/products/wishlist/$', response.json()['routes'])
+
+    def test_fast_serializers_are_timed(self):
+        products = self.make_products(5)
+        for _ in range(20):
+            order = Order.objects.create(user=self.buyer, total_price=100, status=Order.CHECKOUT)
+            OrderItem.objects.bulk_create([OrderItem(order=order, product=product, quantity=1, price=product.price)
+                                           for product in products])
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.client.get(reverse('products:order-history')).status_code, 200)
+        # order history is rendered by FastOrderSerializer alone, no DRF serializer runs
+        stats = request_stats.snapshot()['GET api/products/order/history/']
+        self.assertGreater(stats['mean_serializer_ms'], 0)
+
+    def test_stats_are_staff_only(self):
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.client.get(reverse('products:request-stats')).status_code, 403)
+
+    @override_settings(REQUEST_INSTRUMENTATION=False)
+    def test_disabled_middleware_adds_nothing(self):
+        response = self.client.get(reverse('products:category-list'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(request_stats.snapshot(), {})
+
+
+class ImageDerivativeTests(CatalogueTestMixin, APITestCase):
+    def test_derivatives_are_scheduled_only_when_the_image_changes(self):
+        product = self.make_products(1)[0]
+        with mock.patch('products.signals.schedule_derivatives') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.image.name = 'product_images/ab/abc.jpg'
+                product.save()
+            with self.captureOnCommitCallbacks(execute=True):
+                product.available_quantity = 3
+                product.save()
+                product.save(update_fields=['available_quantity'])
+        self.assertEqual(schedule.call_count, 1)
+
+    def test_up_to_date_derivatives_skip_decoding(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'abc.png')
+            Image.new('RGB', (40, 30)).save(path)
+            self.assertEqual(len(build_derivatives(path, {'thumbnail': (10, 10)}, ['webp'])), 1)
+            with mock.patch('products.images.Image.open', side_effect=AssertionError("decoded")):
+                self.assertEqual(build_derivatives(path, {'thumbnail': (10, 10)}, ['webp']), [])
+
+
+class ImageStorageTests(CatalogueTestMixin, APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=directory.name))
+        self.storage = Product._meta.get_field('image').storage
+
+    def png(self, color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8), color).save(buffer, 'PNG')
+        return ContentFile(buffer.getvalue())
+
+    def stored_files(self):
+        return sorted(name for _, _, files in os.walk(self.storage.path('product_images'))
+                      for name in files if not name.startswith('.'))
+
+    def ref_counts(self):
+        return dict(StoredImage.objects.values_list('name', 'ref_count'))
+
+    def test_identical_uploads_share_one_blob(self):
+        first, second = self.make_products(2)
+        first.image.save('first.png', self.png('red'))
+        second.image.save('second.png', self.png('red'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(self.ref_counts(), {first.image.name: 2})
+
+    def test_deleting_or_replacing_drops_the_reference(self):
+        first, second = self.make_products(2)
+        first.image.save('first.png', self.png('red'))
+        second.image.save('second.png', self.png('red'))
+        red = first.image.name
+        first.delete()
+        self.assertEqual(self.ref_counts(), {red: 1})
+        second.image.save('second.png', self.png('blue'))
+        self.assertEqual(self.ref_counts(), {red: 0, second.image.name: 1})
+
+    def test_collect_orphans_keeps_referenced_blobs(self):
+        product = self.make_products(1)[0]
+        product.image.save('product.png', self.png('red'))
+        red = product.image.name
+        product.image.save('product.png', self.png('blue'))
+        call_command('collect_orphan_images', '--min-age', '0', stdout=io.StringIO())
+        self.assertFalse(self.storage.exists(red))
+        self.assertTrue(self.storage.exists(product.image.name))
+        self.assertEqual(self.ref_counts(), {product.image.name: 1})
+
+
+class SearchTests(CatalogueTestMixin, APITestCase):
+    def test_capped_expansion_keeps_exact_and_frequent_terms(self):
+        for name in ['phonex', 'phoneb', 'phones', 'phones case', 'phones stand', 'phone']:
+            Product.objects.create(name=name, user=self.seller, category=self.category,
+                                   subcategory=self.subcategory, price=100)
+        with mock.patch('products.search.MAX_EXPANSIONS', 2):
+            self.assertEqual(expand_token('phone'), {'phone': EXACT_BOOST, 'phones': PREFIX_BOOST})
+
+
+class CatalogueCacheTests(CatalogueTestMixin, APITestCase):
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.client.force_authenticate(self.buyer)
+
+    def test_category_tree_is_served_from_cache_until_a_write(self):
+        url = reverse('products:category-list')
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.count_queries(url), 0)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': first['ETag']}).status_code, 304)
+
+        self.category.name = 'Phones'
+        self.category.save()
+        response = self.client.get(url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual([category['name'] for category in response.data], ['Phones'])
+
+    def test_subcategory_write_invalidates_filtered_lists(self):
+        url = reverse('products:subcategory-list') + f'?category={self.category.id}'
+        first = self.client.get(url)
+        self.assertEqual([row['name'] for row in first.data], ['Smartphones'])
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': first['ETag']}).status_code, 304)
+
+        Subcategory.objects.create(category=self.category, name='Tablets')
+        response = self.client.get(url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['name'] for row in response.data], ['Smartphones', 'Tablets'])
+
+        Subcategory.objects.get(name='Tablets').delete()
+        self.assertEqual([row['name'] for row in self.client.get(url).data], ['Smartphones'])
+
+
+class FacetTests(CatalogueTestMixin, APITestCase):
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.client.force_authenticate(self.buyer)
+        self.cheap = self.make_products(3)
+        tablets = Subcategory.objects.create(category=self.category, name='Tablets')
+        self.tablet = Product.objects.create(name='tablet', user=self.seller, category=self.category,
+                                             subcategory=tablets, price=20000)
+
+    def get(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('products:list-create-product'), {'facets': 1, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(ctx.captured_queries)
+
+    def test_prices_are_compared_as_numbers(self):
+        data, _ = self.get(min_price='99', max_price='1000')
+        self.assertEqual(len(data['results']), 3)
+        response = self.client.get(reverse('products:list-create-product'), {'min_price': 'cheap'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_facet_counts_cover_the_whole_result_set(self):
+        data, _ = self.get(page_size=1)
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['facets']['category'], [{'id': self.category.id, 'name': 'Mobiles', 'count': 4}])
+        self.assertEqual([(row['name'], row['count']) for row in data['facets']['subcategory']],
+                         [('Smartphones', 3), ('Tablets', 1)])
+        self.assertEqual([(row['min'], row['count']) for row in data['facets']['price'] if row['count']],
+                         [(0, 3), (10000, 1)])
+
+        filtered, _ = self.get(subcategory_id=self.tablet.subcategory_id)
+        self.assertEqual([row['count'] for row in filtered['facets']['subcategory']], [1])
+
+    def test_facet_counts_are_cached_until_a_product_changes(self):
+        _, uncached = self.get()
+        data, cached = self.get()
+        self.assertLess(cached, uncached)
+
+        self.tablet.price = 700
+        self.tablet.save()
+        data, _ = self.get()
+        self.assertEqual([row['count'] for row in data['facets']['price']][:3], [3, 1, 0])
+
+
+class CatalogueImportTests(CatalogueTestMixin, APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(self.seller)
+
+    def upload(self, name, content, **params):
+        upload = SimpleUploadedFile(name, content.encode())
+        return self.client.post(reverse('products:product-import') + ('?update=1' if params.get('update') else ''),
+                                {'file': upload}, format='multipart')
+
+    def test_csv_import_validates_in_batches(self):
+        self.make_products(1)  # product-0 already exists
+        rows = ''.join(f'phone {i},,{100 + i},5,mobiles,SMARTPHONES\n' for i in range(50))
+        content = ('name,description,price,available_quantity,category,subcategory\n' + rows +
+                   'product-0,,100,1,Mobiles,Smartphones\n'
+                   'phone 0,,100,1,Mobiles,Smartphones\n'
+                   'tablet,,100,1,Tablets,Smartphones\n'
+                   'watch,,-5,1,Mobiles,Smartphones\n')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.upload('catalogue.csv', content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 50)
+        self.assertEqual([error['line'] for error in response.json()['errors']], [52, 53, 54, 55])
+        self.assertLess(len(ctx.captured_queries), 20)  # not one query per row
+        self.assertTrue(ProductSearchTerm.objects.filter(term='phone').exists())
+
+    def test_jsonl_import_updates_own_products(self):
+        product = self.make_products(1)[0]
+        response = self.upload('catalogue.jsonl', json.dumps({
+            'name': 'product-0', 'price': 999, 'category': 'Mobiles', 'subcategory': 'Smartphones'}) + '\n',
+            update=True)
+        self.assertEqual(response.json()['updated'], 1)
+        product.refresh_from_db()
+        self.assertEqual((product.price, product.version), (999, 2))
+
+    def test_update_keeps_columns_left_blank(self):
+        product = self.make_products(1)[0]
+        Product.objects.filter(pk=product.pk).update(description='Keep me')
+        response = self.upload('catalogue.csv', 'name,description,price,available_quantity,category,subcategory\n'
+                                                'product-0,,150,,Mobiles,Smartphones\n', update=True)
+        self.assertEqual(response.json()['updated'], 1)
+        product.refresh_from_db()
+        self.assertEqual((product.price, product.description, product.available_quantity), (150, 'Keep me', 10))
+
+    def test_export_streams_own_catalogue(self):
+        self.make_products(3)
+        response = self.client.get(reverse('products:product-export'), {'type': 'csv'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'name,description,price,available_quantity,category,subcategory')
+        self.assertEqual(lines[1:], [f'product-{i},,{100 + i},10,Mobiles,Smartphones' for i in range(3)])
+
+    def test_buyers_cannot_import_or_export(self):
+        self.client.force_authenticate(self.buyer)
+        response = self.upload('catalogue.csv', 'name,description,price,available_quantity,category,subcategory\n'
+                                                'phone,,100,1,Mobiles,Smartphones\n')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get(reverse('products:product-export')).status_code, 403)
+        self.assertFalse(Product.objects.exists())
+
+    def test_import_never_touches_another_sellers_products(self):
+        product = self.make_products(1)[0]
+        other = User.objects.create_user(email='other@example.com', password='pass', username='other', role='seller')
+        self.client.force_authenticate(other)
+        response = self.upload('catalogue.csv', 'name,description,price,available_quantity,category,subcategory\n'
+                                                'product-0,,1,1,Mobiles,Smartphones\n', update=True)
+        self.assertEqual((response.json()['updated'], len(response.json()['errors'])), (0, 1))
+        product.refresh_from_db()
+        self.assertEqual(product.price, 100)
+
+
+class CartStoreTests(CatalogueTestMixin, APITestCase):
+    def setUp(self):
+        self.products = self.make_products(2)
+
+    def add(self, product, quantity, **headers):
+        return self.client.post(reverse('products:cart'), {'product_id': product.id, 'quantity': quantity},
+                                format='json', headers=headers)
+
+    def test_database_store_increments(self):
+        self.client.force_authenticate(self.buyer)
+        self.add(self.products[0], 1)
+        self.assertEqual(self.add(self.products[0], 2).json()['quantity'], 3)
+        self.assertEqual(CartItem.objects.get(user=self.buyer).quantity, 3)
+        self.assertEqual(self.client.post(reverse('products:cart'), {}, format='json').status_code, 400)
+
+    def test_database_store_has_no_guest_carts(self):
+        self.assertEqual(self.client.get(reverse('products:cart')).status_code, 401)
+
+    def test_both_stores_render_the_same_cart(self):
+        self.client.force_authenticate(self.buyer)
+        self.add(self.products[0], 2)
+        cart = self.client.get(reverse('products:cart')).json()
+        with override_settings(CART_STORE='kv', CART_FLUSH_INTERVAL=None):  # seeded from the same CartItem rows
+            self.assertEqual(self.client.get(reverse('products:cart')).json(), cart)
+        self.assertEqual(list(cart[0]), ['product', 'product_id', 'quantity'])
+
+    @override_settings(CART_STORE='kv', CART_FLUSH_INTERVAL=None)
+    def test_guest_cart_is_merged_and_written_behind(self):
+        response = self.add(self.products[0], 2)
+        token = response['X-Cart-Token']
+        self.add(self.products[0], 1, **{'X-Cart-Token': token})
+        self.add(self.products[1], 1, **{'X-Cart-Token': token})
+
+        CartItem.objects.create(user=self.buyer, product=self.products[0], quantity=1)
+        self.client.force_authenticate(self.buyer)
+        cart = self.client.get(reverse('products:cart'), headers={'X-Cart-Token': token}).json()
+        self.assertEqual({item['product']['id']: item['quantity'] for item in cart},
+                         {self.products[0].id: 4, self.products[1].id: 1})
+        self.assertEqual(CartItem.objects.get(user=self.buyer).quantity, 1)  # not flushed yet
+
+        self.client.delete(reverse('products:cart-item', args=[self.products[1].id]))
+        get_cart_store().flush_dirty()
+        self.assertEqual(list(CartItem.objects.filter(user=self.buyer).values_list('product_id', 'quantity')),
+                         [(self.products[0].id, 4)])
+
+        order, _ = place_order(self.buyer)
+        self.assertEqual(order.total_price, 4 * self.products[0].price)
+        self.assertEqual(self.client.get(reverse('products:cart')).json(), [])
+
+
+class InventoryTests(CatalogueTestMixin, APITestCase):
+    def setUp(self):
+        self.product = self.make_products(1)[0]
+        CartItem.objects.create(user=self.buyer, product=self.product, quantity=4)
+        self.order, _ = place_order(self.buyer)
+
+    def assert_stock(self, quantity, reservation_status):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.available_quantity, quantity)
+        self.assertEqual(StockReservation.objects.get(order=self.order).status, reservation_status)
+
+    def test_checkout_reserves_stock(self):
+        self.assert_stock(6, StockReservation.HELD)
+        CartItem.objects.create(user=self.buyer, product=self.product, quantity=7)
+        with self.assertRaises(CheckoutError):
+            place_order(self.buyer)
+        self.assert_stock(6, StockReservation.HELD)
+
+    def test_failed_payment_releases_stock(self):
+        event = StripeEvent.objects.create(event_id='evt_1', type='checkout.session.expired', payload={
+            'data': {'object': {'metadata': {'order_id': str(self.order.id)}}}})
+        apply_events([event])
+        self.assert_stock(10, StockReservation.RELEASED)
+
+    def payment_event(self, event_id, event_type):
+        return StripeEvent.objects.create(event_id=event_id, type=event_type, payload={
+            'data': {'object': {'metadata': {'order_id': str(self.order.id)}}}})
+
+    def test_late_failure_keeps_a_paid_order(self):
+        apply_events([self.payment_event('evt_1', 'checkout.session.completed')])
+        apply_events([self.payment_event('evt_2', 'checkout.session.expired')])
+        self.assertEqual(Order.objects.get(pk=self.order.pk).payment_status, 'completed')
+        self.assert_stock(6, StockReservation.COMMITTED)
+
+    def test_payment_after_expiry_takes_the_stock_again(self):
+        expire_reservations(now=reservation_expiry())
+        apply_events([self.payment_event('evt_1', 'checkout.session.completed')])
+        self.assert_stock(6, StockReservation.COMMITTED)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.payment_status), (Order.CHECKOUT, 'completed'))
+
+    def test_payment_after_stock_is_gone_is_flagged_for_refund(self):
+        expire_reservations(now=reservation_expiry())
+        Product.objects.filter(pk=self.product.pk).update(available_quantity=3)
+        apply_events([self.payment_event('evt_1', 'checkout.session.completed')])
+        self.assert_stock(3, StockReservation.EXPIRED)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.payment_status), (Order.CANCELLED, 'refund_due'))
+
+    def test_payment_after_cancelling_is_flagged_for_refund(self):
+        self.client.force_authenticate(self.buyer)
+        self.client.patch(reverse('products:order-details', args=[self.order.id]), {'status': Order.CANCELLED})
+        apply_events([self.payment_event('evt_1', 'checkout.session.completed')])
+        self.assert_stock(10, StockReservation.RELEASED)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'refund_due')
+
+    def test_abandoned_claims_are_reclaimed(self):
+        event = self.payment_event('evt_1', 'checkout.session.completed')
+        self.assertEqual(claim_events(10), [event])
+        self.assertEqual(claim_events(10), [])
+        StripeEvent.objects.filter(pk=event.pk).update(claimed_at=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(claim_events(10), [event])
+
+    def test_a_bad_event_only_fails_itself(self):
+        paid = self.payment_event('evt_1', 'checkout.session.completed')
+        bad = StripeEvent.objects.create(event_id='evt_2', type='checkout.session.expired', payload=['not an event'])
+        other = self.payment_event('evt_3', 'customer.created')
+        with self.assertLogs('products.webhooks', 'ERROR'):
+            process_pending_events()
+        statuses = dict(StripeEvent.objects.values_list('event_id', 'status'))
+        self.assertEqual(statuses, {paid.event_id: StripeEvent.PROCESSED, bad.event_id: StripeEvent.FAILED,
+                                    other.event_id: StripeEvent.PROCESSED})
+        # one attempt per claim, not one more for the rollback
+        self.assertEqual(StripeEvent.objects.get(pk=bad.pk).attempts, MAX_ATTEMPTS)
+        self.assert_stock(6, StockReservation.COMMITTED)
+
+    def test_cancelling_an_order_releases_stock(self):
+        self.client.force_authenticate(self.buyer)
+        response = self.client.patch(reverse('products:order-details', args=[self.order.id]),
+                                     {'status': Order.CANCELLED})
+        self.assertEqual(response.status_code, 206)
+        self.assert_stock(10, StockReservation.RELEASED)
+
+    def test_sweeper_expires_stale_reservations(self):
+        self.assertEqual(expire_reservations(now=timezone.now()), 0)
+        self.assertEqual(expire_reservations(now=reservation_expiry()), 1)
+        self.assert_stock(10, StockReservation.EXPIRED)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.CANCELLED)
+
+
+class SalesAnalyticsTests(CatalogueTestMixin, APITestCase):
+    def setUp(self):
+        self.phone, self.case = self.make_products(2)
+        other_seller = User.objects.create_user(email='other@example.com', password='pass', username='other',
+                                                role='seller')
+        self.other = Product.objects.create(name='other', user=other_seller, category=self.category,
+                                            subcategory=self.subcategory, price=5)
+        for product, quantity in ((self.phone, 2), (self.case, 1), (self.other, 3)):
+            CartItem.objects.create(user=self.buyer, product=product, quantity=quantity)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:  # rollups are written after commit
+            self.order, _ = place_order(self.buyer)
+            self.assertFalse(DailySellerSales.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+
+    def rollups(self):
+        fields = ['date', 'orders', 'units', 'revenue', 'cancelled_orders', 'cancelled_units', 'cancelled_revenue']
+        return (sorted(DailyProductSales.objects.values_list('product', 'seller', 'category', *fields)),
+                sorted(DailySellerSales.objects.values_list('seller', *fields)))
+
+    def test_rollups_follow_order_status(self):
+        today = timezone.localdate()
+        seller_day = DailySellerSales.objects.get(seller=self.seller)
+        self.assertEqual((seller_day.date, seller_day.orders, seller_day.units, seller_day.revenue),
+                         (today, 1, 3, 2 * 100 + 101))
+
+        self.client.force_authenticate(self.buyer)
+        url = reverse('products:order-details', args=[self.order.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {'status': Order.CANCELLED})
+            self.client.patch(url, {'status': Order.CANCELLED})  # already cancelled, counted once
+        seller_day.refresh_from_db()
+        self.assertEqual((seller_day.cancelled_orders, seller_day.cancelled_units, seller_day.cancelled_revenue),
+                         (1, 3, 301))
+
+        incremental = self.rollups()
+        self.assertEqual(rebuild_rollups(), (3, 2))
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_seller_sales_api_is_scoped_to_the_seller(self):
+        url = reverse('products:seller-sales')
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_authenticate(self.seller)
+        response = self.client.get(url, {'group': 'product'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['name'] for row in response.data['rows']], ['product-0', 'product-1'])
+        self.assertEqual(response.data['totals']['revenue'], 301)
+
+        response = self.client.get(url)
+        self.assertEqual([(row['date'], row['units']) for row in response.data['rows']],
+                         [(timezone.localdate(), 3)])
+        self.assertEqual(self.client.get(url, {'start': 'yesterday'}).status_code, 400)
+
+
+class CheckoutStressTests(TransactionTestCase):
+    def test_concurrent_checkouts_never_oversell(self):
+        seller = get_seller()
+        category = Category.objects.create(name='Mobiles')
+        subcategory = Subcategory.objects.create(category=category, name='Smartphones')
+        product = Product.objects.create(name='last units', user=seller, category=category,
+                                         subcategory=subcategory, price=100, available_quantity=5)
+        buyers = seed_users(20)
+        CartItem.objects.bulk_create([CartItem(user=buyer, product=product, quantity=1) for buyer in buyers])
+
+        def checkout(buyer):
+            try:
+                place_order(buyer)
+                return True
+            except CheckoutError:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            placed = sum(executor.map(checkout, buyers))
+
+        product.refresh_from_db()
+        self.assertEqual(placed, 5)
+        self.assertEqual(product.available_quantity, 0)
+        self.assertEqual(sum(StockReservation.objects.values_list('quantity', flat=True)), 5)
+
+
+class CheckoutTests(CatalogueTestMixin, APITestCase):
+    def setUp(self):
+        for product in self.make_products(3):
+            CartItem.objects.create(user=self.buyer, product=product, quantity=2)
+
+    def checkout(self, url, stripe_server):
+        with override_settings(STRIPE_API_BASE=stripe_server.url, STRIPE_SECRET_KEY='sk_test_fake'):
+            token = RefreshToken.for_user(self.buyer).access_token
+            return self.client.post(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def assert_order_placed(self, response, stripe_server):
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(user=self.buyer)
+        self.assertEqual(response.json()['checkout_url'], f'https://checkout.stripe.test/{order.payment_intent_id}')
+        self.assertEqual(order.total_price, 2 * (100 + 101 + 102))
+        self.assertEqual(order.order_items.count(), 3)
+        self.assertFalse(CartItem.objects.filter(user=self.buyer).exists())
+        self.assertEqual(set(Product.objects.values_list('available_quantity', flat=True)), {8})
+        path, params = stripe_server.requests[-1]
+        self.assertEqual(path, '/v1/checkout/sessions')
+        self.assertEqual(params['metadata[order_id]'], [str(order.id)])
+
+    def test_checkout(self):
+        with FakeStripeServer() as stripe_server:
+            response = self.checkout(reverse('products:checkout'), stripe_server)
+        self.assert_order_placed(response, stripe_server)
+
+    def test_async_checkout_retries_transient_stripe_errors(self):
+        with FakeStripeServer(failures=1) as stripe_server:
+            response = self.checkout(reverse('products:checkout-async'), stripe_server)
+        self.assert_order_placed(response, stripe_server)
+        self.assertEqual(len(stripe_server.requests), 2)
+
+    def test_stripe_failure_cancels_the_order(self):
+        for url in (reverse('products:checkout'), reverse('products:checkout-async')):
+            with FakeStripeServer(failures=10) as stripe_server:
+                response = self.checkout(url, stripe_server)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(Order.objects.get(user=self.buyer).status, Order.CANCELLED)
+            self.assertEqual(set(Product.objects.values_list('available_quantity', flat=True)), {10})
+            self.assertEqual(set(StockReservation.objects.values_list('status', flat=True)),
+                             {StockReservation.RELEASED})
+            Order.objects.all().delete()
+            for product in Product.objects.all():
+                CartItem.objects.create(user=self.buyer, product=product, quantity=2)
+
+    def test_async_checkout_requires_authentication(self):
+        response = self.client.post(reverse('products:checkout-async'))
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Order.objects.exists())
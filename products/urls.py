@@ -1,12 +1,14 @@
 from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
 from products.views import (CategoryViewSet, SubCategoryViewSet,
-                            AddProductAPIView, ProductDetailAPIView,
+                            AddProductAPIView, ProductDetailAPIView, ProductImportView, ProductExportView,
                             ProductRatingAPIView,
                             CartView, CartItemDetailView, ClearCartView,
-                            OrderCheckoutView, OrderHistioryView, OrderDetailView,
+                            OrderCheckoutView, AsyncOrderCheckoutView, OrderHistioryView, OrderDetailView,
                             WishlistAPIView,payment_success, checkout_page,payment_cancel, StripeWebhookView,
-                            checkout_view)
+                            checkout_view, SellerSalesView, RequestStatsView)
 from rest_framework.routers import DefaultRouter
+from products.compression import compression_exempt
 
 app_name = 'products'
 
@@ -19,14 +21,17 @@ urlpatterns = [
     # product
     path('add-product/', AddProductAPIView.as_view(), name='list-create-product'),
     path('product/<int:pk>/', ProductDetailAPIView.as_view(), name='product-detail'),
+    path('products/import/', ProductImportView.as_view(), name='product-import'),
+    path('products/export/', ProductExportView.as_view(), name='product-export'),
 
     # cart
     path('cart/', CartView.as_view(), name='cart'),
-    path('cart/<int:product_id>/', CartItemDetailView.as_view(), name='cart-item'),
-    path('cart/clear/', ClearCartView.as_view(), name='remove-cart_item'),
+    path('cart/<int:product_id>/', compression_exempt(CartItemDetailView.as_view()), name='cart-item'),
+    path('cart/clear/', compression_exempt(ClearCartView.as_view()), name='remove-cart_item'),
 
     # order-history
     path('checkout/', OrderCheckoutView.as_view(), name='checkout'),
+    path('checkout/async/', csrf_exempt(AsyncOrderCheckoutView.as_view()), name='checkout-async'),
     # path('checkout-page/', checkout_page, name='checkout'),
     # path('cart/checkout/<int:order_id>/', checkout_view, name='checkout-page'),
     path('order/history/', OrderHistioryView.as_view(), name='order-history'),
@@ -35,9 +40,15 @@ urlpatterns = [
     path('payment-success/', payment_success, name='payment_success'),
     path('payment-cancel/', payment_cancel, name='payment_cancel'),
     
-    path("stripe/webhook/", StripeWebhookView.as_view(), name="stripe_webhook"),
+    path("stripe/webhook/", compression_exempt(StripeWebhookView.as_view()), name="stripe_webhook"),
 
     # product-rating
     path('ratings/', ProductRatingAPIView.as_view(), name='ratings'),
+
+    # seller analytics
+    path('sales/', SellerSalesView.as_view(), name='seller-sales'),
+
+    # instrumentation (staff only)
+    path('stats/requests/', RequestStatsView.as_view(), name='request-stats'),
 ]
 urlpatterns += router.urls
\ No newline at end of file
@@ -1,45 +1,74 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse
 from rest_framework import generics, views, viewsets, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from accounts.authentication import CachedJWTAuthentication
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
-from accounts.permissions import IsOwnerOrReadonly
+from accounts.permissions import IsOwnerOrReadonly, IsSeller
 from products.models import (Category, Subcategory,
                              Product, CartItem, Rating,
                              OrderItem, Order,
-                             Wishlist)
+                             Wishlist, StripeEvent, StockReservation)
 from products.serializers import (CategorySerializer, SubCategorySerializer,
                                   ProductSerializer, ProductRatingSerializer,
                                   CartItemSerializer,
                                   OrderSerializer, OrderItemSerializer,
                                   WishlistSerializer)
 from products.filters import ProductFilter
+from products.search import ProductSearchFilter
+from products.cache import get_cached_catalog, conditional_catalog_response
+from products.mixins import (CartStoreMixin, ConditionalRequestMixin, FacetMixin, FastListMixin,
+                             StreamingListMixin)
+from products.fast_serializers import FastCartItemSerializer, FastOrderSerializer, FastProductSerializer
+from products.checkout import CheckoutError, place_order
+from products.inventory import cancel_unpaid_orders, release_reservations
+from products.analytics import SALES_GROUPS, record_status_change, seller_sales
+from products.catalog_io import CatalogueImport, FORMATS, export_rows, guess_format, read_rows
+from products.payments import get_stripe_client, get_async_stripe_client, checkout_session_params
+from products.instrumentation import registry as request_stats
+from products.pagination import (ProductCursorPagination, OrderCursorPagination,
+                                 RatingCursorPagination)
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views import View
 from django.views.generic import TemplateView
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+import json
 import stripe
+from datetime import timedelta
 
 
 # Create your views here.
 
 # category-view
 class CategoryViewSet(viewsets.ModelViewSet):
-    queryset = Category.objects.all()
+    queryset = Category.objects.prefetch_related('subcategories')
     serializer_class = CategorySerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
+    # full category -> subcategory tree, served from cache
+    def list(self, request, *args, **kwargs):
+        entry = get_cached_catalog(
+            'category-tree', lambda: self.get_serializer(self.get_queryset(), many=True).data
+        )
+        return conditional_catalog_response(request, entry)
+
 
 # subcategory-view
 class SubCategoryViewSet(viewsets.ModelViewSet):
     queryset = Subcategory.objects.all()
     serializer_class = SubCategorySerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -51,17 +80,31 @@ class SubCategoryViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    # all subcategories or those of ?category=<id>, served from cache
+    def list(self, request, *args, **kwargs):
+        category_id = request.query_params.get("category") or 'all'
+        if not (category_id == 'all' or category_id.isdigit()):
+            return super().list(request, *args, **kwargs)
+
+        entry = get_cached_catalog(
+            f'subcategories:{category_id}', lambda: self.get_serializer(self.get_queryset(), many=True).data
+        )
+        return conditional_catalog_response(request, entry)
+
 
 # product-view
-class AddProductAPIView(generics.ListCreateAPIView):
+class AddProductAPIView(StreamingListMixin, FastListMixin, FacetMixin, ConditionalRequestMixin,
+                        generics.ListCreateAPIView):
     parser_class = [MultiPartParser, FormParser]
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsOwnerOrReadonly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter]
     filterset_class = ProductFilter
-    search_fields = ['name', 'category__name', 'subcategory__name']
+    pagination_class = ProductCursorPagination
+    fast_serializer_class = FastProductSerializer
+    fast_extra_columns = ('version', 'updated_at')
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -72,23 +115,61 @@ class AddProductAPIView(generics.ListCreateAPIView):
     #     return queryset
 
 
-class ProductDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class ProductDetailAPIView(ConditionalRequestMixin, generics.RetrieveUpdateDestroyAPIView):
     parser_class = [MultiPartParser, FormParser]
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
 
-class ProductRatingAPIView(generics.ListCreateAPIView):
+# bulk catalogue import/export (CSV or JSONL)
+class ProductImportView(views.APIView):
+    parser_classes = [MultiPartParser]
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsSeller]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Upload a CSV or JSONL file as 'file'."}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = guess_format(upload.name)
+        importer = CatalogueImport(request.user, update=request.query_params.get('update') in ('1', 'true'))
+        return Response(importer.run(read_rows(upload, fmt)), status=status.HTTP_200_OK)
+
+
+class ProductExportView(views.APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsSeller]
+
+    def get(self, request, *args, **kwargs):
+        # not `format`, which DRF reserves for renderer selection
+        fmt = request.query_params.get('type', 'csv')
+        if fmt not in FORMATS:
+            return Response({"error": f"type must be one of {', '.join(FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(
+            export_rows(Product.objects.filter(user=request.user), fmt),
+            content_type='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+        )
+        response['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+        return response
+
+
+class ProductRatingAPIView(StreamingListMixin, generics.ListCreateAPIView):
     serializer_class = ProductRatingSerializer
     queryset = Rating.objects.all()
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = RatingCursorPagination
 
     def perform_create(self, serializer):
         user = self.request.user
-        serializer.save(user=user)
+        with transaction.atomic():
+            rating = serializer.save(user=user)
+            Product.objects.filter(pk=rating.product_id).update_with_version(
+                rating_count=F('rating_count') + 1,
+                rating_sum=F('rating_sum') + rating.rating,
+            )
 
     # def get_queryset(self):
     #     user = self.request.user
@@ -96,28 +177,26 @@ class ProductRatingAPIView(generics.ListCreateAPIView):
 
 
 # cart-view
-class CartView(generics.ListCreateAPIView):
+class CartView(CartStoreMixin, generics.ListCreateAPIView):
     serializer_class = CartItemSerializer
-    queryset = CartItem.objects.all()
-    authentication_classes = [JWTAuthentication]
-    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [AllowAny]  # guests are identified by X-Cart-Token, see CartStoreMixin
 
-    def get_queryset(self):
-        user = self.request.user
-        return user.cart_items.all()
+    def list(self, request, *args, **kwargs):
+        rows = self.cart_store.rows(self.get_cart_owner(), FastCartItemSerializer.plan()[0])
+        return Response(FastCartItemSerializer(rows, request=request).data)
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            product_id = request.data.get('product_id')
-            quantity = request.data.get('quantity')
-            user = request.user
+            product = serializer.validated_data['product_id']
+            quantity = serializer.validated_data['quantity']
 
-            cart_item, created = CartItem.objects.get_or_create(user=user, product_id=product_id, quantity=quantity)
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
+            stock = product.available_quantity
+            if stock is not None and stock < quantity:
+                return Response({"error": f"Only {stock} left in stock"}, status=status.HTTP_400_BAD_REQUEST)
 
+            cart_item = self.cart_store.add(self.get_cart_owner(), product, quantity)
             serializer = CartItemSerializer(cart_item)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -125,31 +204,39 @@ class CartView(generics.ListCreateAPIView):
 
 
 # cart_item-view
-class CartItemDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = CartItem.objects.all()
+class CartItemDetailView(CartStoreMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CartItemSerializer
-    authentication_classes = [JWTAuthentication]
-    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [AllowAny]
 
     def get_object(self):
-        user = self.request.user
+        owner = self.get_cart_owner()
         product_id = self.kwargs['product_id']
-        cart_item = CartItem.objects.filter(user=user, product_id=product_id).first()
+        cart_item = self.cart_store.get(owner, product_id)
         if not cart_item:
-            return CartItem(user=user, product_id=product_id, quantity=0)
+            product = get_object_or_404(Product, pk=product_id)
+            return CartItem(user=None if isinstance(owner, str) else owner, product=product, quantity=0)
         return cart_item
 
+    def update(self, request, *args, **kwargs):
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=kwargs.pop('partial', False))
+        serializer.is_valid(raise_exception=True)
+        quantity = serializer.validated_data.get('quantity', instance.quantity)
+        cart_item = self.cart_store.set(self.get_cart_owner(), instance.product, quantity)
+        return Response(self.get_serializer(cart_item).data)
+
+    def perform_destroy(self, instance):
+        self.cart_store.remove(self.get_cart_owner(), instance.product.pk)
+
 
 # clear-cart
-class ClearCartView(views.APIView):
-    queryset = CartItem.objects.all()
-    authentication_classes = [JWTAuthentication]
-    permission_classes = [IsAuthenticated]
+class ClearCartView(CartStoreMixin, views.APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [AllowAny]
 
     def delete(self, request, *args, **kwargs):
-        user = request.user
-        cart_items = user.cart_items.all()
-        cart_items.delete()
+        self.cart_store.clear(self.get_cart_owner())
         return Response({"detail": "Removed all items from the cart"}, status=status.HTTP_204_NO_CONTENT)
 
 
@@ -231,61 +318,67 @@ class ClearCartView(views.APIView):
         
 class OrderCheckoutView(generics.GenericAPIView):
     serializer_class = OrderSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
-        user = request.user
-        cart_items = CartItem.objects.filter(user=user)
+        try:
+            order, cart_items = place_order(request.user)
+        except CheckoutError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        if not cart_items.exists():
-            return Response({"error": "No items in cart"}, status=status.HTTP_400_BAD_REQUEST)
+        params = checkout_session_params(
+            order, cart_items,
+            success_url=request.build_absolute_uri(reverse("products:payment_success")),
+            cancel_url=request.build_absolute_uri(reverse("products:payment_cancel")),
+        )
 
-        stripe.api_key = settings.STRIPE_SECRET_KEY
+        # Create Stripe Checkout Session for INR Payments
+        try:
+            checkout_session = get_stripe_client().checkout.sessions.create(params=params)
+        except stripe.error.StripeError as e:
+            cancel_unpaid_orders([order.pk])  # nothing can be paid: don't hold the stock until the sweeper runs
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        line_items = []
-        total_price = 0
+        Order.objects.filter(pk=order.pk).update(payment_intent_id=checkout_session["id"])
 
-        for item in cart_items:
-            line_items.append({
-                "price_data": {
-                    "currency":"inr",
-                    "unit_amount": int(item.product.price * 100),  # INR to Paisa
-                    "product_data": {
-                        "name": item.product.name
-                    }
-                },
-                "quantity": item.quantity,
-            })
-            total_price += item.product.price * item.quantity
+        return Response({"checkout_url": checkout_session.url}, status=status.HTTP_201_CREATED) 
 
-        # Create an Order
-        order = Order.objects.create(user=user, total_price=total_price, status=Order.CHECKOUT)
 
-        for item in cart_items:
-            OrderItem.objects.create(order=order, product=item.product, quantity=item.quantity, price=item.product.price)
+# checkout without holding a worker thread while Stripe responds; runs natively on the event loop
+# when served through e_commerce_webapp.asgi
+class AsyncOrderCheckoutView(View):
+    async def post(self, request, *args, **kwargs):
+        try:
+            authenticated = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({"detail": str(e.detail)}, status=401)
+        if authenticated is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+        user, _ = authenticated
 
-        cart_items.delete()  # Empty the cart after checkout
+        try:
+            order, cart_items = await sync_to_async(place_order)(user)
+        except CheckoutError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        params = checkout_session_params(
+            order, cart_items,
+            success_url=request.build_absolute_uri(reverse("products:payment_success")),
+            cancel_url=request.build_absolute_uri(reverse("products:payment_cancel")),
+        )
 
-        # Create Stripe Checkout Session for INR Payments
         try:
-            checkout_session = stripe.checkout.Session.create(
-                payment_method_types=["card",],  # Only INR payment methods
-                line_items=line_items,
-                mode="payment",
-                currency="inr",
-                success_url=request.build_absolute_uri(reverse("products:payment_success")) + "?session_id={CHECKOUT_SESSION_ID}",
-                cancel_url=request.build_absolute_uri(reverse("products:payment_cancel")),
-                metadata={"order_id": order.id},
-            )
+            checkout_session = await get_async_stripe_client().checkout.sessions.create_async(params=params)
         except stripe.error.StripeError as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            await sync_to_async(cancel_unpaid_orders)([order.pk])
+            return JsonResponse({"error": str(e)}, status=400)
+
+        await Order.objects.filter(pk=order.pk).aupdate(payment_intent_id=checkout_session["id"])
+
+        return JsonResponse({"checkout_url": checkout_session.url}, status=201)
 
-        order.payment_intent_id = checkout_session["id"]
-        order.save()
 
-        return Response({"checkout_url": checkout_session.url}, status=status.HTTP_201_CREATED) 
-    
 class StripeWebhookView(APIView):
     """Handles Stripe Webhook Events"""
     permission_classes = [AllowAny]  # Webhooks don't require authentication
@@ -304,18 +397,12 @@ class StripeWebhookView(APIView):
         except stripe.error.SignatureVerificationError:
             return JsonResponse({"error": "Invalid signature"}, status=400)
 
-        # Handle Payment Success Event
-        if event["type"] == "checkout.session.completed":
-            session = event["data"]["object"]
-            order_id = session.get("metadata", {}).get("order_id")
-
-            if order_id:
-                try:
-                    order = Order.objects.get(id=order_id)
-                    order.status = "PAID" 
-                    order.save()
-                except Order.DoesNotExist:
-                    return JsonResponse({"error": "Order not found"}, status=404)
+        # record the event and acknowledge; `manage.py process_stripe_events` applies it to the order.
+        # Redelivered events hit the unique event_id and are dropped here.
+        StripeEvent.objects.bulk_create(
+            [StripeEvent(event_id=event["id"], type=event["type"], payload=json.loads(payload))],
+            ignore_conflicts=True,
+        )
 
         return JsonResponse({"status": "success"}, status=200)
 
@@ -346,9 +433,9 @@ class PaymentConfirmationView(APIView):
 
         try:
             # Confirm the PaymentIntent on Stripe
-            payment_intent = stripe.PaymentIntent.confirm(
+            payment_intent = get_stripe_client().payment_intents.confirm(
                 payment_intent_id,
-                payment_method=payment_method_id
+                params={"payment_method": payment_method_id}
             )
 
             # Check if payment was successful
@@ -395,22 +482,24 @@ class PaymentConfirmationView(APIView):
 #                 return e
 
 # order-history
-class OrderHistioryView(generics.ListAPIView):
+class OrderHistioryView(FastListMixin, generics.ListAPIView):
     serializer_class = OrderSerializer
-    authentication_classes = [JWTAuthentication]
+    fast_serializer_class = FastOrderSerializer
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
 
     def get_queryset(self):
         user = self.request.user
-        queryset = Order.objects.filter(user=user).order_by('-created_at')
+        queryset = Order.objects.with_items().filter(user=user).order_by('-created_at', '-id')
         return queryset
 
 
 # order-detail and cancel
 class OrderDetailView(generics.RetrieveUpdateAPIView):
-    queryset = Order.objects.all()
+    queryset = Order.objects.with_items()
     serializer_class = OrderSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def patch(self, request, *args, **kwargs):
@@ -421,12 +510,23 @@ class OrderDetailView(generics.RetrieveUpdateAPIView):
                 return Response({'details': "You cannot cancel the order once it shipped"},
                                 status=status.HTTP_400_BAD_REQUEST)
 
-            order.status = Order.CANCELLED
-            order.save()
+            with transaction.atomic():
+                # conditional, so a concurrent cancel can't release stock or count the cancellation twice
+                if Order.objects.filter(pk=order.pk, status=order.status).update(status=Order.CANCELLED):
+                    # held or already sold stock goes back on the shelf
+                    release_reservations([order.pk], statuses=(StockReservation.HELD, StockReservation.COMMITTED))
+                    record_status_change([order.pk], order.status, Order.CANCELLED)
             return Response({'detail': "Order has been Cancelled"}, status=status.HTTP_206_PARTIAL_CONTENT)
 
         return super().patch(request, *args, **kwargs)
 
+    def perform_update(self, serializer):
+        old_status = serializer.instance.status
+        with transaction.atomic():
+            order = serializer.save()
+            if order.status != old_status:
+                record_status_change([order.pk], old_status, order.status)
+
 
 from django.utils.decorators import method_decorator
 
@@ -446,12 +546,62 @@ def checkout_view(request, order_id):
         "STRIPE_PUBLIC_KEY": settings.STRIPE_PUBLIC_KEY
     })
 
-class WishlistAPIView(viewsets.ModelViewSet):
+class WishlistAPIView(StreamingListMixin, viewsets.ModelViewSet):
     serializer_class = WishlistSerializer
-    queryset = Wishlist.objects.all()
-    authentication_classes = [JWTAuthentication]
+    queryset = Wishlist.objects.select_related('product')
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
         user = self.request.user
-        serializer.save(user=user)
+        try:
+            with transaction.atomic():
+                serializer.save(user=user)
+        except IntegrityError:
+            raise ValidationError({"product": "Product is already in your wishlist."})
+
+
+# seller analytics
+class SellerSalesView(views.APIView):
+    """Sales of the requesting seller's products, served from the daily rollups (products.analytics)."""
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsSeller]
+    max_days = 366
+
+    def get(self, request, *args, **kwargs):
+        try:
+            end = self.get_date('end') or timezone.localdate()
+            start = self.get_date('start') or end - timedelta(days=29)
+        except ValueError:
+            return Response({"error": "start and end must be YYYY-MM-DD dates"}, status=status.HTTP_400_BAD_REQUEST)
+        if not timedelta(0) <= end - start < timedelta(days=self.max_days):
+            return Response({"error": f"start must be on or before end, at most {self.max_days} days apart"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        group = request.query_params.get('group', 'day')
+        if group not in SALES_GROUPS:
+            return Response({"error": f"group must be one of {', '.join(SALES_GROUPS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(seller_sales(request.user, start, end, group))
+
+    def get_date(self, param):
+        value = self.request.query_params.get(param)
+        if not value:
+            return None
+        parsed = parse_date(value)
+        if parsed is None:
+            raise ValueError(value)
+        return parsed
+
+
+# request instrumentation
+class RequestStatsView(views.APIView):
+    """Per-route query/latency aggregates collected by QueryInstrumentationMiddleware in this process."""
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({"enabled": settings.REQUEST_INSTRUMENTATION, "routes": request_stats.snapshot()})
+
+    def delete(self, request, *args, **kwargs):
+        request_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,128 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from products.inventory import commit_reservations, release_reservations
+from products.models import Order, StripeEvent
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+
+# Stripe event type -> Order.payment_status it moves the order to
+PAYMENT_TRANSITIONS = {
+    'checkout.session.completed': 'completed',
+    'checkout.session.async_payment_succeeded': 'completed',
+    'checkout.session.async_payment_failed': 'failed',
+    'checkout.session.expired': 'failed',
+}
+
+
+def claim_events(batch_size):
+    """
+    Atomically move up to `batch_size` pending events to processing so concurrent workers never share one.
+    A claim lasts STRIPE_EVENT_CLAIM_TIMEOUT seconds; events left in processing after that (a worker died
+    mid-batch) are claimed again. Applying an event twice is harmless (see apply_events). Each claim counts
+    as one attempt, so an event that keeps killing its worker still runs out of attempts.
+    """
+    now = timezone.now()
+    claimable = Q(status=StripeEvent.PENDING) | Q(
+        status=StripeEvent.PROCESSING, claimed_at__lt=now - timedelta(seconds=settings.STRIPE_EVENT_CLAIM_TIMEOUT)
+    )
+    with transaction.atomic():
+        ids = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(claimable)
+            .order_by('received_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        StripeEvent.objects.filter(claimable, id__in=ids).update(
+            status=StripeEvent.PROCESSING, claimed_at=now, attempts=F('attempts') + 1)
+    return list(StripeEvent.objects.filter(id__in=ids, status=StripeEvent.PROCESSING, claimed_at=now)
+                .order_by('received_at'))
+
+
+def get_order_id(event):
+    metadata = event.payload.get('data', {}).get('object', {}).get('metadata') or {}
+    order_id = metadata.get('order_id')
+    return int(order_id) if str(order_id or '').isdigit() else None
+
+
+def apply_events(events):
+    """
+    Apply a batch of claimed events to their orders with one bulk_update per table. The orders are
+    locked for the whole batch, so two workers handling events for the same order see each other's
+    writes and a completed payment is never overwritten (nor its stock released).
+    """
+    now = timezone.now()
+    changed = {}
+
+    with transaction.atomic():
+        orders = {order.pk: order for order in Order.objects.select_for_update().filter(
+            pk__in={get_order_id(event) for event in events} - {None}).order_by('pk')}
+
+        for event in events:
+            event.processed_at = now
+            event.status = StripeEvent.PROCESSED
+            event.last_error = None
+
+            payment_status = PAYMENT_TRANSITIONS.get(event.type)
+            if payment_status is None:
+                continue  # event type we don't act on
+
+            order = orders.get(get_order_id(event))
+            if order is None:
+                event.status = StripeEvent.FAILED
+                event.last_error = "Order not found"
+                continue
+
+            # a late failure/expiry never overrides a completed payment (or one waiting for its refund)
+            if order.payment_status not in ('completed', 'refund_due', payment_status):
+                order.payment_status = payment_status
+                changed[order.pk] = order
+
+        Order.objects.bulk_update(changed.values(), ['payment_status'])
+        # paid orders keep their stock, failed or expired payments put it back
+        commit_reservations([pk for pk, order in changed.items() if order.payment_status == 'completed'])
+        release_reservations([pk for pk, order in changed.items() if order.payment_status == 'failed'])
+        StripeEvent.objects.bulk_update(events, ['status', 'processed_at', 'last_error'])
+    return len(changed)
+
+
+def release_events(events, error):
+    """Put events back in the queue after an unexpected error, giving up after MAX_ATTEMPTS claims."""
+    for event in events:
+        event.last_error = str(error)
+        event.status = StripeEvent.FAILED if event.attempts >= MAX_ATTEMPTS else StripeEvent.PENDING
+    StripeEvent.objects.bulk_update(events, ['status', 'last_error'])
+
+
+def apply_or_release(events):
+    """
+    Apply a batch, bisecting it when it fails so the good events still go through in bulk and only the
+    event that raises is released. apply_events rolls back as a whole, so retrying a half is safe.
+    """
+    try:
+        apply_events(events)
+    except Exception as exc:
+        if len(events) == 1:
+            logger.exception("Applying Stripe event %s failed", events[0].event_id)
+            release_events(events, exc)
+            return
+        middle = len(events) // 2
+        apply_or_release(events[:middle])
+        apply_or_release(events[middle:])
+
+
+def process_pending_events(batch_size=100):
+    """Drain the inbox in batches; returns the number of events handled."""
+    handled = 0
+    while True:
+        events = claim_events(batch_size)
+        if not events:
+            return handled
+        apply_or_release(events)
+        handled += len(events)
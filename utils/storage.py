@@ -0,0 +1,49 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage, storages
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every distinct file once, named by the SHA-256 of its bytes
+    (`<dir>/<2 hex chars>/<digest>.<ext>`), so re-uploading the same image reuses the stored copy.
+    The digest is computed while the upload is streamed to disk chunk by chunk.
+    """
+    chunk_size = 64 * 1024
+
+    def get_available_name(self, name, max_length=None):
+        # the final name is the digest, picked in _save; never append random suffixes
+        return name
+
+    def _save(self, name, content):
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        os.makedirs(self.path(directory or '.'), exist_ok=True)
+
+        digest = hashlib.sha256()
+        # temp file inside the storage so the final rename stays on one filesystem (atomic)
+        with tempfile.NamedTemporaryFile(dir=self.path(directory or '.'), prefix='.upload-', delete=False) as tmp:
+            if hasattr(content, 'seek'):
+                content.seek(0)
+            for chunk in content.chunks(self.chunk_size):
+                digest.update(chunk)
+                tmp.write(chunk)
+
+        hexdigest = digest.hexdigest()
+        final_name = os.path.join(directory, hexdigest[:2], f'{hexdigest}{extension}').replace('\\', '/')
+        final_path = self.path(final_name)
+
+        if os.path.exists(final_path):
+            os.remove(tmp.name)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp.name, final_path)
+            if self.file_permissions_mode is not None:
+                os.chmod(final_path, self.file_permissions_mode)
+        return final_name
+
+
+def product_image_storage():
+    return storages['product_images']